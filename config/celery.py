@@ -12,6 +12,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Автоматически находим и регистрируем задачи
 app.autodiscover_tasks()
 
+# Сигналы для метрик задач (ожидание в очереди, время выполнения, ошибки)
+from . import task_metrics  # noqa: E402,F401
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
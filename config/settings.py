@@ -17,6 +17,7 @@ from decouple import config, Csv
 import json
 from django.core.serializers.json import DjangoJSONEncoder
 from dotenv import load_dotenv
+from kombu import Queue
 
 # Р—Р°РіСЂСѓР¶Р°РµРј РїРµСЂРµРјРµРЅРЅС‹Рµ РёР· .env С„Р°Р№Р»Р°
 load_dotenv()
@@ -63,6 +64,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # РЎС‚РѕСЂРѕРЅРЅРёРµ РїСЂРёР»РѕР¶РµРЅРёСЏ
     'rest_framework',
@@ -218,6 +220,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'UPDATE_LAST_LOGIN': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.RoleTokenObtainPairSerializer',
 
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
@@ -338,6 +341,31 @@ SPECTACULAR_SETTINGS = {
 # Stripe Configuration
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
+# Адрес Stripe API; для нагрузочных тестов - локальная замена (manage.py fake_stripe)
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')
+# Префикс ключей идемпотентности продуктов и цен Stripe: свой для каждого окружения
+# (staging/prod на одном аккаунте) и для каждой пересозданной БД, иначе id объектов совпадут
+STRIPE_IDEMPOTENCY_PREFIX = os.getenv('STRIPE_IDEMPOTENCY_PREFIX', 'kurs')
+# Время жизни в кеше ID цены Stripe для курса/урока (секунды)
+STRIPE_PRICE_CACHE_TIMEOUT = int(os.getenv('STRIPE_PRICE_CACHE_TIMEOUT', 24 * 60 * 60))
+# Событий вебхука, применяемых в одной транзакции
+STRIPE_EVENTS_BATCH_SIZE = int(os.getenv('STRIPE_EVENTS_BATCH_SIZE', 200))
+# Сверка платежей: за сколько часов смотреть сессии (сессия живет не больше суток)
+STRIPE_RECONCILE_WINDOW_HOURS = int(os.getenv('STRIPE_RECONCILE_WINDOW_HOURS', 24))
+# Кеш сессий Checkout для опроса статуса: время жизни и сколько опрос ждет
+# чужой запрос к Stripe за той же сессией (секунды)
+STRIPE_SESSION_CACHE_TTL = int(os.getenv('STRIPE_SESSION_CACHE_TTL', 2))
+STRIPE_SESSION_WAIT_TIMEOUT = float(os.getenv('STRIPE_SESSION_WAIT_TIMEOUT', 5))
+# Время жизни в кеше набора оплаченных пользователем курсов и уроков (секунды)
+ENTITLEMENTS_CACHE_TIMEOUT = int(os.getenv('ENTITLEMENTS_CACHE_TIMEOUT', 24 * 60 * 60))
+# HTTP-клиент Stripe: таймауты (секунды), повторы и размер keep-alive пула
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 3))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 10))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', 2))
+STRIPE_POOL_SIZE = int(os.getenv('STRIPE_POOL_SIZE', 10))
+# Предохранитель: после скольких сбоев подряд и на сколько секунд прекращать вызовы Stripe
+STRIPE_BREAKER_THRESHOLD = int(os.getenv('STRIPE_BREAKER_THRESHOLD', 5))
+STRIPE_BREAKER_RESET_TIMEOUT = int(os.getenv('STRIPE_BREAKER_RESET_TIMEOUT', 30))
 
 # РќР°СЃС‚СЂРѕР№РєРё Redis РёР· РїРµСЂРµРјРµРЅРЅС‹С… РѕРєСЂСѓР¶РµРЅРёСЏ
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
@@ -351,3 +379,107 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Очереди Celery: рассылки не должны задерживать платежи. Каждую очередь
+# обслуживает свой воркер (см. docker-compose.yaml) со своими concurrency
+# и prefetch; воркер без -Q слушает все очереди.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = [
+    Queue('default'),
+    Queue('notifications'),
+    Queue('payments'),
+    Queue('maintenance'),
+]
+CELERY_TASK_ROUTES = {
+    'courses.tasks.send_course_update_*': {'queue': 'notifications', 'priority': 6},
+    'courses.tasks.send_pending_course_update': {'queue': 'notifications', 'priority': 6},
+    'courses.tasks.record_course_update_totals': {'queue': 'notifications', 'priority': 6},
+    'courses.tasks.relay_notification_outbox': {'queue': 'notifications', 'priority': 3},
+    'users.tasks.*payment*': {'queue': 'payments', 'priority': 0},
+    'users.tasks.*stripe*': {'queue': 'payments', 'priority': 0},
+    'courses.tasks.check_inactive_users': {'queue': 'maintenance', 'priority': 9},
+    'courses.tasks.prune_notification_deliveries': {'queue': 'maintenance', 'priority': 9},
+    'courses.tasks.prune_tombstones': {'queue': 'maintenance', 'priority': 9},
+    'users.tasks.block_inactive_users': {'queue': 'maintenance', 'priority': 9},
+}
+# Приоритеты внутри очереди в Redis: 0 - самый высокий
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+# Длинные рассылки не должны забирать задачи впрок у соседних процессов
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 1))
+
+# Кеш (Redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_CACHE_URL', f'redis://{REDIS_HOST}:{REDIS_PORT}/1'),
+        'KEY_PREFIX': 'kurs',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'socket_connect_timeout': 2,
+            'socket_timeout': 2,
+            'max_connections': int(os.getenv('REDIS_CACHE_MAX_CONNECTIONS', 50)),
+        },
+    }
+}
+
+# Время жизни закешированных ответов API курсов (секунды)
+COURSE_CACHE_TIMEOUT = int(os.getenv('COURSE_CACHE_TIMEOUT', 300))
+
+# Роли пользователей: время жизни в кеше и доверие claim 'roles' из JWT
+ROLES_CACHE_TIMEOUT = int(os.getenv('ROLES_CACHE_TIMEOUT', 300))
+ROLES_FROM_JWT = os.getenv('ROLES_FROM_JWT', 'False').lower() == 'true'
+
+# Рассылка об обновлении курса: подписчиков на одно SMTP-соединение
+COURSE_UPDATE_EMAIL_CHUNK_SIZE = int(os.getenv('COURSE_UPDATE_EMAIL_CHUNK_SIZE', 500))
+
+# Окно (секунды), за которое правки курса объединяются в одно уведомление
+COURSE_UPDATE_NOTIFY_WINDOW = int(os.getenv('COURSE_UPDATE_NOTIFY_WINDOW', 4 * 60 * 60))
+
+# Периодические задачи
+CELERY_BEAT_SCHEDULE = {
+    # Сводка обновлений курсов для подписок в режиме digest
+    'send-course-update-digests': {
+        'task': 'courses.tasks.send_course_update_digests',
+        'schedule': timedelta(hours=int(os.getenv('COURSE_UPDATE_DIGEST_PERIOD_HOURS', 24))),
+    },
+    # Рассылка правок курсов из NotificationOutbox, у которых истекло окно уведомлений
+    'relay-notification-outbox': {
+        'task': 'courses.tasks.relay_notification_outbox',
+        'schedule': timedelta(seconds=int(os.getenv('NOTIFICATION_OUTBOX_RELAY_INTERVAL', 10))),
+    },
+    # Страховка на случай потерянного запуска из вебхука
+    'process-stripe-events': {
+        'task': 'users.tasks.process_stripe_events',
+        'schedule': timedelta(seconds=30),
+    },
+    'reconcile-stripe-payments': {
+        'task': 'users.tasks.reconcile_stripe_payments',
+        'schedule': timedelta(minutes=int(os.getenv('STRIPE_RECONCILE_INTERVAL_MINUTES', 5))),
+    },
+    'prune-notification-deliveries': {
+        'task': 'courses.tasks.prune_notification_deliveries',
+        'schedule': timedelta(days=1),
+    },
+    'prune-tombstones': {
+        'task': 'courses.tasks.prune_tombstones',
+        'schedule': timedelta(days=1),
+    },
+}
+
+# Outbox уведомлений: курсов за одну транзакцию ретранслятора, через сколько
+# секунд неотправленные правки передаются в рассылку заново и срок хранения
+# отметок об отправке (дни)
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.getenv('NOTIFICATION_OUTBOX_BATCH_SIZE', 500))
+NOTIFICATION_RELAY_TIMEOUT = int(os.getenv('NOTIFICATION_RELAY_TIMEOUT', 60 * 60))
+NOTIFICATION_DELIVERY_RETENTION_DAYS = int(os.getenv('NOTIFICATION_DELIVERY_RETENTION_DAYS', 7))
+
+# Срок хранения отметок об удалении (дни): клиент, не синхронизировавшийся
+# дольше, получает 410 от ленты /deleted/ и загружает каталог заново
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('TOMBSTONE_RETENTION_DAYS', 30))
+
+# Блокировка неактивных пользователей: строк в одной транзакции
+INACTIVE_USERS_CHUNK_SIZE = int(os.getenv('INACTIVE_USERS_CHUNK_SIZE', 1000))
@@ -0,0 +1,107 @@
+# config/task_metrics.py
+import time
+from datetime import datetime
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.core.cache import cache
+
+METRIC_KEY = 'task_metrics:{name}:{field}'
+# Завершенные задачи по минутам для расчета пропускной способности
+THROUGHPUT_KEY = 'task_metrics:{name}:done:{minute}'
+THROUGHPUT_MINUTES = 15
+
+FIELDS = ('published', 'started', 'succeeded', 'failed', 'retried', 'wait_ms', 'run_ms')
+POSTRUN_FIELDS = {'SUCCESS': 'succeeded', 'FAILURE': 'failed', 'RETRY': 'retried'}
+
+# Время старта выполняемых задач текущего процесса
+_started = {}
+
+
+def _incr(key, delta=1, timeout=None):
+    cache.add(key, 0, timeout=timeout)
+    cache.incr(key, delta)
+
+
+def _record(name, field, delta=1):
+    _incr(METRIC_KEY.format(name=name, field=field), delta)
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp() if value else 0
+
+
+@before_task_publish.connect
+def mark_published(sender=None, headers=None, **kwargs):
+    """Время постановки в очередь едет вместе с задачей в заголовке"""
+    if headers is not None:
+        headers['published_at'] = time.time()
+    _record(sender, 'published')
+
+
+@task_prerun.connect
+def mark_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.monotonic()
+    _record(task.name, 'started')
+
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        # Для задач с countdown/eta ожидание считается от назначенного времени
+        ready_at = max(published_at, _timestamp(task.request.eta))
+        _record(task.name, 'wait_ms', max(int((time.time() - ready_at) * 1000), 0))
+
+
+@task_postrun.connect
+def mark_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        _record(task.name, 'run_ms', int((time.monotonic() - started) * 1000))
+    if state in POSTRUN_FIELDS:
+        _record(task.name, POSTRUN_FIELDS[state])
+    minute = int(time.time() // 60)
+    _incr(THROUGHPUT_KEY.format(name=task.name, minute=minute), timeout=(THROUGHPUT_MINUTES + 1) * 60)
+
+
+def get_task_metrics(names):
+    """
+    Счетчики по задачам: поставлено, начато, успешно, с ошибкой, повторено;
+    среднее ожидание в очереди и время выполнения (мс); завершено за
+    последнюю минуту и в среднем в минуту за THROUGHPUT_MINUTES минут.
+    """
+    minute = int(time.time() // 60)
+    keys = {}
+    for name in names:
+        for field in FIELDS:
+            keys[METRIC_KEY.format(name=name, field=field)] = (name, field)
+        for offset in range(1, THROUGHPUT_MINUTES + 1):
+            keys[THROUGHPUT_KEY.format(name=name, minute=minute - offset)] = (name, offset)
+    values = cache.get_many(keys)
+
+    metrics = {name: {field: 0 for field in FIELDS} | {'throughput': [0] * THROUGHPUT_MINUTES} for name in names}
+    for key, value in values.items():
+        name, field = keys[key]
+        if isinstance(field, int):
+            metrics[name]['throughput'][field - 1] = value
+        else:
+            metrics[name][field] = value
+
+    result = {}
+    for name, data in metrics.items():
+        if not data['published'] and not data['started']:
+            continue
+        started = data['started'] or 1
+        throughput = data.pop('throughput')
+        result[name] = {
+            'published': data['published'],
+            'started': data['started'],
+            'succeeded': data['succeeded'],
+            'failed': data['failed'],
+            'retried': data['retried'],
+            'avg_wait_ms': data['wait_ms'] // started,
+            'avg_run_ms': data['run_ms'] // started,
+            'per_minute_last': throughput[0],
+            'per_minute_avg': round(sum(throughput) / THROUGHPUT_MINUTES, 2),
+        }
+    return result
+
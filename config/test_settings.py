@@ -0,0 +1,12 @@
+# config/test_settings.py
+"""
+Настройки для тестов: python manage.py test --settings=config.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+# Каждый прогон получает собственный чистый кеш, Redis не нужен
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
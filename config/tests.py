@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from config.celery import app as celery_app
+from courses.tasks import send_course_update_email
+
+User = get_user_model()
+
+
+class TaskMetricsTests(APITestCase):
+    """Тесты метрик задач Celery"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(email='metrics-admin@example.com', password='testpass123')
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    def test_metrics_endpoint(self):
+        """Тест: выполненные задачи попадают в метрики, эндпоинт доступен только администратору"""
+        send_course_update_email.delay(0, 'Добавлен урок')
+
+        response = self.client.get('/api/metrics/tasks/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/metrics/tasks/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = response.data['courses.tasks.send_course_update_email']
+        self.assertEqual((metrics['started'], metrics['succeeded'], metrics['failed']), (1, 1, 0))
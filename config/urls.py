@@ -6,6 +6,8 @@ from django.shortcuts import redirect
 from django.http import JsonResponse
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from .views import TaskMetricsView
+
 
 def api_root(request):
     return JsonResponse({
@@ -38,6 +40,7 @@ urlpatterns = [
     # 2. Критически важно: Сначала ВСЕ другие маршруты с префиксом /api/
     path('api/users/', include('users.urls', namespace='users')),
     path('api/courses/', include('courses.urls')),
+    path('api/metrics/tasks/', TaskMetricsView.as_view(), name='task-metrics'),
 
     # 3. Маршруты документации (тоже начинаются с /api/)
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
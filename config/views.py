@@ -0,0 +1,16 @@
+# config/views.py
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .celery import app
+from .task_metrics import get_task_metrics
+
+
+class TaskMetricsView(APIView):
+    """Метрики задач Celery для подбора числа воркеров (только администраторы)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        names = sorted(name for name in app.tasks if not name.startswith('celery.'))
+        return Response(get_task_metrics(names))
@@ -0,0 +1,100 @@
+# courses/cache.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+from users.roles import get_request_roles
+
+CATALOG_VERSION_KEY = 'course_cache:catalog_version'
+COURSE_VERSION_KEY = 'course_cache:course_version:{course_id}'
+USER_VERSION_KEY = 'course_cache:user_version:{user_id}'
+RESPONSE_KEY = 'course_cache:response:{digest}'
+STATE_KEY = 'course_cache:state:{digest}'
+
+
+def get_versions(keys):
+    """Текущие версии для ключей; отсутствующие версии создаются"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump_versions(keys):
+    def bump():
+        cache.set_many({key: time.time_ns() for key in keys}, timeout=None)
+
+    # Второй сброс после коммита не дает закешировать данные,
+    # прочитанные параллельным запросом до завершения транзакции
+    bump()
+    transaction.on_commit(bump)
+
+
+def invalidate_course(course_id):
+    """Сбрасывает кеш деталей курса и всех страниц списка курсов"""
+    _bump_versions([CATALOG_VERSION_KEY, COURSE_VERSION_KEY.format(course_id=course_id)])
+
+
+def invalidate_user(user_id):
+    """Сбрасывает пользовательскую часть кеша (например, is_subscribed)"""
+    _bump_versions([USER_VERSION_KEY.format(user_id=user_id)])
+
+
+def course_version_keys(user_id, course_id=None):
+    """
+    Ключи версий, от которых зависит ответ по курсам: курс (или весь
+    каталог для списка) и подписки пользователя
+    """
+    if course_id is None:
+        scope_key = CATALOG_VERSION_KEY
+    else:
+        scope_key = COURSE_VERSION_KEY.format(course_id=course_id)
+    return [scope_key, USER_VERSION_KEY.format(user_id=user_id)]
+
+
+def build_response_cache_key(request, version_keys, key_template=RESPONSE_KEY):
+    user = request.user
+    parts = [
+        request.path,
+        '&'.join(sorted(request.GET.urlencode().split('&'))),
+        str(user.pk),
+        ','.join(sorted(get_request_roles(request))),
+        *map(str, get_versions(version_keys)),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return key_template.format(digest=digest)
+
+
+class CachedCourseResponseMixin:
+    """
+    Кеширует ответы list/retrieve CourseViewSet в Redis.
+
+    Ключ учитывает путь, параметры запроса, пользователя и его роли,
+    а также версии курса, каталога и подписок пользователя. Версии
+    меняются сигналами при изменении Course, Lesson и Subscription,
+    поэтому устаревшие ответы просто перестают находиться.
+    """
+
+    def _cached_response(self, handler, course_id, request, *args, **kwargs):
+        key = build_response_cache_key(request, course_version_keys(request.user.pk, course_id))
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.COURSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, None, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        course_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self._cached_response(super().retrieve, course_id, request, *args, **kwargs)
@@ -0,0 +1,89 @@
+# courses/conditional.py
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from users.roles import get_request_roles
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified для list/retrieve и ответ 304 без сериализации.
+
+    Состояние ресурса берется одним легким запросом: updated_at объекта для
+    деталей, Max(updated_at) и количество строк для списка. Last-Modified
+    отдается только для деталей: по максимуму updated_at нельзя заметить
+    удаление строки из списка, поэтому для списков используется только ETag.
+    """
+
+    def get_conditional_queryset(self):
+        """Queryset для вычисления состояния (без тяжелых аннотаций)"""
+        return self.get_queryset()
+
+    def get_etag_extra(self, request, pk=None):
+        """Дополнительные части ETag (например, пользовательские данные)"""
+        return []
+
+    def build_etag(self, request, parts):
+        parts = [
+            request.path,
+            '&'.join(sorted(request.GET.urlencode().split('&'))),
+            request.META.get('HTTP_ACCEPT', ''),
+            str(request.user.pk),
+            ','.join(sorted(get_request_roles(request))),
+            *map(str, parts),
+        ]
+        return hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_conditional_state(self, request, pk=None):
+        """
+        Состояние ресурса: (last_modified, части ETag).
+        Для отсутствующего объекта возвращает None.
+        """
+        if pk is None:
+            queryset = self.filter_queryset(self.get_conditional_queryset())
+            state = queryset.aggregate(last_modified=Max('updated_at'), total=Count('pk'))
+            last_modified = state['last_modified']
+            return last_modified, [last_modified.isoformat() if last_modified else '', state['total']]
+
+        try:
+            last_modified = self.get_conditional_queryset().filter(
+                **{self.lookup_field: pk}
+            ).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            # Некорректный pk: 404 вернет get_object_or_404 в retrieve
+            return None
+        if last_modified is None:
+            return None
+        return last_modified, [last_modified.isoformat()]
+
+    def _conditional_response(self, handler, etag, last_modified, request, *args, **kwargs):
+        etag = quote_etag(etag)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        _, parts = self.get_conditional_state(request)
+        etag = self.build_etag(request, [*parts, *self.get_etag_extra(request)])
+        return self._conditional_response(super().list, etag, None, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        state = self.get_conditional_state(request, pk)
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        last_modified, parts = state
+        etag = self.build_etag(request, [*parts, *self.get_etag_extra(request, pk)])
+        return self._conditional_response(super().retrieve, etag, last_modified, request, *args, **kwargs)
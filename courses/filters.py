@@ -0,0 +1,72 @@
+# courses/filters.py
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F
+from django_filters import rest_framework as django_filters
+from rest_framework import filters
+
+from .models import SEARCH_CONFIG, Course, Lesson, Tombstone
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Полнотекстовый поиск PostgreSQL вместо ILIKE '%q%' по search_fields.
+
+    Ищет по полю search_vector (tsvector с GIN-индексом) и сортирует
+    результаты по ts_rank. Явный ?ordering= обрабатывается OrderingFilter
+    и имеет приоритет над релевантностью. Для моделей без search_vector
+    работает как обычный SearchFilter.
+    """
+    search_vector_field = 'search_vector'
+    search_type = 'websearch'
+
+    def has_search_vector(self, model):
+        try:
+            model._meta.get_field(self.search_vector_field)
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or not self.has_search_vector(queryset.model):
+            return super().filter_queryset(request, queryset, view)
+
+        query = SearchQuery(' '.join(search_terms), config=SEARCH_CONFIG, search_type=self.search_type)
+        return queryset.filter(
+            **{self.search_vector_field: query}
+        ).annotate(
+            search_rank=SearchRank(F(self.search_vector_field), query)
+        ).order_by('-search_rank', 'pk')
+
+
+class UpdatedSinceFilterSet(django_filters.FilterSet):
+    """
+    ?updated_since=<ISO 8601> - только объекты, измененные начиная с этого момента.
+
+    Граница включается, поэтому клиенту достаточно передавать время
+    последней синхронизации; повторно полученные объекты он просто перезапишет.
+    """
+    updated_since = django_filters.IsoDateTimeFilter(field_name='updated_at', lookup_expr='gte')
+
+
+class CourseFilter(UpdatedSinceFilterSet):
+    class Meta:
+        model = Course
+        fields = []
+
+
+class LessonFilter(UpdatedSinceFilterSet):
+    class Meta:
+        model = Lesson
+        fields = ['course']
+
+
+class TombstoneFilter(django_filters.FilterSet):
+    """Фильтр ленты удаленных объектов (тот же параметр ?updated_since=)"""
+    updated_since = django_filters.IsoDateTimeFilter(field_name='deleted_at', lookup_expr='gte')
+    course = django_filters.NumberFilter(field_name='course_id')
+
+    class Meta:
+        model = Tombstone
+        fields = []
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.10 on 2026-10-17 16:13
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('courses', '0004_subscription_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(choices=[('course', 'Курс'), ('lesson', 'Урок')], max_length=20, verbose_name='Тип объекта')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID объекта')),
+                ('owner_id', models.PositiveBigIntegerField(verbose_name='ID владельца')),
+                ('course_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID курса')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленный объект',
+                'verbose_name_plural': 'Удаленные объекты',
+                'ordering': ['deleted_at'],
+            },
+        ),
+        AddIndexConcurrently(
+            model_name='course',
+            index=models.Index(fields=['updated_at'], name='course_updated_at_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=models.Index(fields=['updated_at'], name='lesson_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model_name', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ),
+    ]
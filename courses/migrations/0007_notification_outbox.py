@@ -0,0 +1,42 @@
+# Generated by Django 5.2.10 on 2026-10-17 16:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_subscription_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lesson_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='ID урока')),
+                ('title', models.CharField(blank=True, max_length=255, verbose_name='Название урока')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course', verbose_name='Курс')),
+            ],
+            options={
+                'verbose_name': 'Событие для уведомления',
+                'verbose_name_plural': 'События для уведомления',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificationDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Ключ идемпотентности')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата отправки')),
+            ],
+            options={
+                'verbose_name': 'Отправленное уведомление',
+                'verbose_name_plural': 'Отправленные уведомления',
+                'indexes': [models.Index(fields=['created_at'], name='notification_delivery_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='stripe_price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Цена в Stripe'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='stripe_price_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Цена в Stripe'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_stripe_price_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='relayed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Передано в окно уведомлений'),
+        ),
+    ]
@@ -1,8 +1,21 @@
 ﻿# courses/models.py - ОБНОВЛЕННЫЕ модели
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.utils import timezone
 
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+
+
+def build_search_vector():
+    """tsvector по названию (вес A) и описанию (вес B) с русской конфигурацией"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
 
 class Course(models.Model):
     """Модель курса"""
@@ -44,14 +57,35 @@ class Course(models.Model):
         null=True,
         help_text="Автоматически создается при первой оплате"
     )
+    # Цена, для которой создан stripe_price_id: при смене цены создается новая
+    stripe_price_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        verbose_name="Цена в Stripe"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    # Поисковый вектор поддерживается самой БД (GENERATED ... STORED)
+    search_vector = models.GeneratedField(
+        expression=build_search_vector(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
+
     class Meta:
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='course_search_vector_gin'),
+            # Инкрементальная синхронизация (?updated_since=)
+            models.Index(fields=['updated_at'], name='course_updated_at_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.pk:
@@ -112,14 +146,35 @@ class Lesson(models.Model):
         null=True,
         help_text="Автоматически создается при первой оплате"
     )
+    # Цена, для которой создан stripe_price_id: при смене цены создается новая
+    stripe_price_amount = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        blank=True,
+        null=True,
+        verbose_name="Цена в Stripe"
+    )
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
+    # Поисковый вектор поддерживается самой БД (GENERATED ... STORED)
+    search_vector = models.GeneratedField(
+        expression=build_search_vector(),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name="Поисковый вектор",
+    )
+
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
         ordering = ['created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lesson_search_vector_gin'),
+            # Инкрементальная синхронизация (?updated_since=)
+            models.Index(fields=['updated_at'], name='lesson_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -138,6 +193,8 @@ class Subscription(models.Model):
         verbose_name="Курс"
     )
     is_active = models.BooleanField(default=True, verbose_name="Активна")
+    # Обновления курса приходят не отдельными письмами, а в периодической сводке
+    digest = models.BooleanField(default=False, verbose_name="Сводка")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
     class Meta:
@@ -145,7 +202,121 @@ class Subscription(models.Model):
         verbose_name_plural = "Подписки"
         unique_together = ['user', 'course']
         ordering = ['-created_at']
+        indexes = [
+            # Рассылка об обновлении курса выбирает активных подписчиков курса
+            models.Index(fields=['course', 'id'], name='subscription_active_course_idx',
+                         condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         status = "активна" if self.is_active else "неактивна"
         return f"{self.user.email} -> {self.course.title} ({status})"
+
+
+class DigestEntry(models.Model):
+    """
+    Обновление курса, ожидающее отправки в сводке подписчика.
+
+    На пару пользователь-курс хранится одна строка: повторные обновления
+    курса до отправки сводки только сдвигают updated_at.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь"
+    )
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        verbose_name="Курс"
+    )
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Обновление для сводки"
+        verbose_name_plural = "Обновления для сводки"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='digest_entry_user_course_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.course_id} ({self.updated_at})"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Правка курса, ожидающая уведомления подписчиков.
+
+    Пишется в той же транзакции, что и сама правка, поэтому откаченные
+    изменения не рассылаются, а закоммиченные не теряются. Строки забирает
+    relay_notification_outbox и передает в окно уведомлений курса; удаляются
+    они только после отправки уведомления.
+    """
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        verbose_name="Курс"
+    )
+    # Без урока правка относится к самому курсу
+    lesson_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="ID урока")
+    title = models.CharField(max_length=255, blank=True, verbose_name="Название урока")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    relayed_at = models.DateTimeField(null=True, blank=True, verbose_name="Передано в окно уведомлений")
+
+    class Meta:
+        verbose_name = "Событие для уведомления"
+        verbose_name_plural = "События для уведомления"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Курс {self.course_id}, урок {self.lesson_id} ({self.created_at})"
+
+
+class NotificationDelivery(models.Model):
+    """
+    Отметка об отправленном письме: ключ уведомления и получателя.
+    Повтор задачи рассылки пропускает получателей, уже имеющих отметку.
+    """
+    key = models.CharField(max_length=255, unique=True, verbose_name="Ключ идемпотентности")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата отправки")
+
+    class Meta:
+        verbose_name = "Отправленное уведомление"
+        verbose_name_plural = "Отправленные уведомления"
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_delivery_idx'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class Tombstone(models.Model):
+    """
+    Отметка об удаленном курсе или уроке.
+
+    Нужна клиентам с офлайн-режимом: вместе с ?updated_since= позволяет
+    синхронизироваться инкрементально. Владелец и курс хранятся простыми
+    числами, потому что связанные строки к этому моменту уже удалены.
+    """
+    MODEL_CHOICES = [
+        ('course', 'Курс'),
+        ('lesson', 'Урок'),
+    ]
+
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES, verbose_name="Тип объекта")
+    object_id = models.PositiveBigIntegerField(verbose_name="ID объекта")
+    owner_id = models.PositiveBigIntegerField(verbose_name="ID владельца")
+    course_id = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="ID курса")
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата удаления")
+
+    class Meta:
+        verbose_name = "Удаленный объект"
+        verbose_name_plural = "Удаленные объекты"
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['model_name', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id} удален {self.deleted_at}"
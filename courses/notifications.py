@@ -0,0 +1,132 @@
+# courses/notifications.py
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import DigestEntry, NotificationOutbox, Subscription
+
+
+def queue_course_update(course_id, lessons=None):
+    """
+    Записывает правку курса в NotificationOutbox.
+
+    Вызывается внутри транзакции, которая сохраняет правку: уведомление
+    появляется только вместе с закоммиченными изменениями. Без lessons
+    правка относится к самому курсу.
+    """
+    if lessons:
+        rows = [NotificationOutbox(course_id=course_id, lesson_id=lesson.pk, title=lesson.title) for lesson in lessons]
+    else:
+        rows = [NotificationOutbox(course_id=course_id)]
+    NotificationOutbox.objects.bulk_create(rows)
+
+
+def relay_outbox(batch_size):
+    """
+    Передает в рассылку правки курсов, у которых истекло окно уведомлений
+    COURSE_UPDATE_NOTIFY_WINDOW: срок курса - время его самой старой
+    неотправленной правки плюс окно, и все правки курса к этому моменту
+    уходят одним уведомлением send_pending_course_update.
+
+    Строки остаются в outbox с отметкой relayed_at и удаляются только после
+    отправки. Если задача не удалила их за NOTIFICATION_RELAY_TIMEOUT
+    (потеряна брокером, упал воркер), правки передаются заново; повтор
+    безопасен, рассылка идемпотентна по ключу уведомления. Задачи ставятся
+    после коммита. Заблокированные другим ретранслятором строки
+    пропускаются, поэтому ретрансляторы можно запускать параллельно.
+    Возвращает число курсов.
+    """
+    now = timezone.now()
+    pending = NotificationOutbox.objects.filter(
+        Q(relayed_at__isnull=True) | Q(relayed_at__lt=now - timedelta(seconds=settings.NOTIFICATION_RELAY_TIMEOUT))
+    )
+    due_before = now - timedelta(seconds=settings.COURSE_UPDATE_NOTIFY_WINDOW)
+    with transaction.atomic():
+        course_ids = list(
+            pending.values('course_id').annotate(first=Min('created_at')).filter(first__lte=due_before)
+            .order_by('first').values_list('course_id', flat=True)[:batch_size]
+        )
+        rows = list(
+            pending.select_for_update(skip_locked=True).filter(course_id__in=course_ids)
+            .order_by('id').values_list('id', 'course_id')
+        )
+        NotificationOutbox.objects.filter(id__in=[row_id for row_id, _ in rows]).update(relayed_at=now)
+        last_ids = {}
+        for row_id, course_id in rows:
+            last_ids[course_id] = row_id
+        from .tasks import send_pending_course_update
+        for course_id, last_id in last_ids.items():
+            transaction.on_commit(partial(send_pending_course_update.delay, course_id, last_id))
+    return len(course_ids)
+
+
+def take_course_changes(course_id, last_id):
+    """
+    Переданные в рассылку правки курса с id события не больше last_id:
+    список измененных уроков [(id, название), ...] без повторов, признак
+    изменения самого курса и ключ уведомления для идемпотентной рассылки
+    (None, если правок уже нет - их отправила предыдущая копия задачи).
+    После отправки события удаляет release_course_changes.
+    """
+    rows = NotificationOutbox.objects.filter(course_id=course_id, relayed_at__isnull=False, id__lte=last_id)
+    lessons, course_changed, found = {}, False, False
+    for lesson_id, title in rows.order_by('id').values_list('lesson_id', 'title'):
+        found = True
+        if lesson_id is None:
+            course_changed = True
+        else:
+            lessons[lesson_id] = title
+    notification_key = course_notification_key(course_id, last_id) if found else None
+    return list(lessons.items()), course_changed, notification_key
+
+
+def release_course_changes(course_id, last_id):
+    """Удаляет отправленные события курса (id не больше last_id)"""
+    NotificationOutbox.objects.filter(course_id=course_id, relayed_at__isnull=False, id__lte=last_id).delete()
+
+
+def course_notification_key(course_id, last_id):
+    """
+    Ключ уведомления для идемпотентной рассылки: id событий outbox не
+    повторяются, поэтому ключ уникален для каждой пачки правок
+    """
+    return f'course-update:{course_id}:{last_id}'
+
+
+def build_update_message(lessons, course_changed):
+    """Текст уведомления по накопленным правкам"""
+    lines = []
+    if course_changed or not lessons:
+        lines.append("Материалы курса были обновлены.")
+    if lessons:
+        lines.append("Обновлены уроки:")
+        lines.extend(f"- {title}" for _, title in lessons)
+    return '\n'.join(lines)
+
+
+def record_digest_updates(course_id, chunk_size):
+    """
+    Отмечает обновление курса для подписчиков в режиме сводки: одна строка
+    DigestEntry на пару пользователь-курс, повторное обновление только
+    сдвигает ее updated_at. Возвращает число затронутых подписчиков.
+    """
+    now = timezone.now()
+    user_ids = Subscription.objects.filter(
+        course_id=course_id, is_active=True, digest=True
+    ).values_list('user_id', flat=True).iterator(chunk_size=chunk_size)
+
+    total = 0
+    while chunk := list(islice(user_ids, chunk_size)):
+        DigestEntry.objects.bulk_create(
+            [DigestEntry(user_id=user_id, course_id=course_id, updated_at=now) for user_id in chunk],
+            update_conflicts=True,
+            unique_fields=['user', 'course'],
+            update_fields=['updated_at'],
+        )
+        total += len(chunk)
+    return total
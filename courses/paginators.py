@@ -1,4 +1,7 @@
-﻿from rest_framework.pagination import PageNumberPagination
+﻿from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 
 class CoursePagination(PageNumberPagination):
@@ -20,3 +23,181 @@ class SubscriptionPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 50
+
+
+class PaymentPagination(PageNumberPagination):
+    """Пагинация для платежей"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по всем полям ordering (например, created_at и id).
+
+    Позиция курсора - значения всех полей ordering, поэтому строки с
+    одинаковым created_at не пропускаются и не повторяются, а смещение
+    в курсоре не нужно. Порядок фиксирован: ?ordering= (OrderingFilter)
+    в этом режиме не действует.
+    """
+    position_separator = '|'
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(self.ordering)
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            value = instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return self.position_separator.join(values)
+
+    def get_position_filter(self, queryset, position, reverse):
+        """
+        Условие "строго после позиции" в порядке обхода:
+        (a > x) OR (a = x AND b > y) для ordering (a, b)
+        """
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = None
+        for order, value in reversed(list(zip(self.ordering, values))):
+            field_name = order.lstrip('-')
+            try:
+                value = queryset.model._meta.get_field(field_name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            step = Q(**{f'{field_name}__{lookup}': value})
+            condition = step if condition is None else step | (Q(**{field_name: value}) & condition)
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Повторяет CursorPagination.paginate_queryset, но фильтрует по всем полям ordering
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*(
+                order[1:] if order.startswith('-') else f'-{order}' for order in self.ordering
+            ))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.get_position_filter(queryset, current_position, reverse))
+
+        # Лишняя строка показывает, есть ли следующая страница
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+class CourseCursorPagination(KeysetCursorPagination):
+    """Keyset-пагинация для курсов (по created_at, id)"""
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-created_at', '-id')
+
+
+class LessonCursorPagination(KeysetCursorPagination):
+    """Keyset-пагинация для уроков (по created_at, id)"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('created_at', 'id')
+
+
+class SubscriptionCursorPagination(KeysetCursorPagination):
+    """Keyset-пагинация для подписок (по created_at, id)"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    ordering = ('-created_at', '-id')
+
+
+class PaymentCursorPagination(KeysetCursorPagination):
+    """Keyset-пагинация для платежей (по created_at, id)"""
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class TombstoneCursorPagination(KeysetCursorPagination):
+    """Keyset-пагинация для ленты удаленных объектов (по deleted_at, id)"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('deleted_at', 'id')
+
+
+class SelectablePaginationMixin:
+    """
+    Миксин для ViewSet: позволяет клиенту выбрать режим пагинации на запрос.
+
+    По умолчанию используется pagination_class (номера страниц с COUNT и OFFSET).
+    При ?pagination=cursor или переданном ?cursor=... используется
+    cursor_pagination_class: без COUNT(*) и со стабильным временем ответа
+    на любой глубине. В этом режиме порядок задает пагинатор, а
+    ?ordering= не учитывается.
+    """
+    cursor_pagination_class = None
+    pagination_mode_query_param = 'pagination'
+
+    def use_cursor_pagination(self):
+        if self.cursor_pagination_class is None:
+            return False
+        params = self.request.query_params
+        return (
+            params.get(self.pagination_mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_cursor_pagination():
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
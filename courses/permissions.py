@@ -1,12 +1,14 @@
 from rest_framework import permissions
 
+from users.roles import is_moderator
+
 
 class IsModerator(permissions.BasePermission):
     """
     Проверка, является ли пользователь модератором
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='moderators').exists()
+        return is_moderator(request)
 
     def has_object_permission(self, request, view, obj):
         return self.has_permission(request, view)
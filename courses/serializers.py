@@ -1,8 +1,10 @@
 ﻿# courses/serializers.py
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Course, Lesson, Subscription
+from django.utils import timezone
+from .models import Course, Lesson, Subscription, Tombstone
 from .validators import validate_youtube_url, validate_no_external_links
 from drf_spectacular.utils import extend_schema_field
 from drf_spectacular.types import OpenApiTypes
@@ -10,10 +12,67 @@ from drf_spectacular.types import OpenApiTypes
 User = get_user_model()
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Выборочные поля и раскрытие вложенных объектов по параметрам запроса.
+
+    ?fields=id,title - в ответе только перечисленные поля (для GET-запросов);
+    ?expand=lessons - поля из expandable_fields выводятся только по запросу.
+    """
+    expandable_fields = ()
+    always_loaded_fields = ('id', 'created_at')
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    @staticmethod
+    def get_query_list(request, param):
+        value = request.query_params.get(param, '')
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """Запрошенные поля или None, если нужны все"""
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        return cls.get_query_list(request, cls.fields_query_param) or None
+
+    @classmethod
+    def get_expanded_fields(cls, request):
+        """Раскрываемые поля, запрошенные через ?expand= или ?fields="""
+        if request is None:
+            return set()
+        requested = cls.get_query_list(request, cls.expand_query_param)
+        requested |= cls.get_requested_fields(request) or set()
+        return requested & set(cls.expandable_fields)
+
+    @classmethod
+    def is_field_rendered(cls, request, name):
+        if name in cls.expandable_fields:
+            return name in cls.get_expanded_fields(request)
+        requested = cls.get_requested_fields(request)
+        return requested is None or name in requested
+
+    @classmethod
+    def get_only_fields(cls, request):
+        """Колонки модели для queryset.only() или None, если нужны все"""
+        requested = cls.get_requested_fields(request)
+        if not requested:
+            return None
+        concrete = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        return sorted((requested & concrete) | set(cls.always_loaded_fields))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        for name in list(self.fields):
+            if not self.is_field_rendered(request, name):
+                self.fields.pop(name)
+
+
+class LessonSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Lesson
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('created_at', 'updated_at')
 
     def validate_video_url(self, value):
@@ -39,15 +98,87 @@ class LessonSerializer(serializers.ModelSerializer):
         return data
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    lessons_count = serializers.IntegerField(source='lessons.count', read_only=True)
+class LessonListSerializer(serializers.ListSerializer):
+    """
+    Массовое создание и обновление уроков.
+
+    Уроки проходят ту же валидацию, что и по одному, но записываются
+    одним bulk_create/bulk_update. При обновлении каждый элемент должен
+    содержать id урока из переданного queryset.
+    """
+
+    def get_instance_map(self):
+        if not hasattr(self, '_instance_map'):
+            self._instance_map = {lesson.pk: lesson for lesson in self.instance}
+        return self._instance_map
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+
+        try:
+            lesson = self.get_instance_map().get(int(data.get('id')))
+        except (AttributeError, TypeError, ValueError):
+            lesson = None
+        if lesson is None:
+            raise serializers.ValidationError({'id': 'Урок не найден'})
+
+        self.child.instance = lesson
+        self.child.initial_data = data
+        attrs = super().run_child_validation(data)
+        attrs['id'] = lesson.pk
+        return attrs
+
+    def create(self, validated_data):
+        return Lesson.objects.bulk_create([Lesson(**attrs) for attrs in validated_data])
+
+    def update(self, instance, validated_data):
+        lessons = self.get_instance_map()
+        now = timezone.now()
+        updated, fields = [], {'updated_at'}
+        for attrs in validated_data:
+            lesson = lessons[attrs.pop('id')]
+            for name, value in attrs.items():
+                setattr(lesson, name, value)
+            # bulk_update не обновляет auto_now поля сам
+            lesson.updated_at = now
+            fields.update(attrs)
+            updated.append(lesson)
+        Lesson.objects.bulk_update(updated, fields)
+        return updated
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PK-поле, которое загружает каждый объект один раз за запрос"""
+
+    def to_internal_value(self, data):
+        objects = self.__dict__.setdefault('_objects', {})
+        if str(data) not in objects:
+            objects[str(data)] = super().to_internal_value(data)
+        return objects[str(data)]
+
+
+class LessonBulkSerializer(LessonSerializer):
+    """Урок в массовых операциях: владелец - текущий пользователь"""
+    owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    # Уроки пачки обычно относятся к одному курсу - не ищем его для каждого
+    course = CachedPrimaryKeyRelatedField(queryset=Course.objects.all())
+
+    class Meta(LessonSerializer.Meta):
+        list_serializer_class = LessonListSerializer
+
+
+class CourseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    expandable_fields = ('lessons',)
+
+    lessons_count = serializers.SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True)
     owner = serializers.HiddenField(default=serializers.CurrentUserDefault())
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
-        fields = '__all__'
+        exclude = ('search_vector',)
 
     def validate_description(self, value):
         """Валидация описания курса на внешние ссылки"""
@@ -58,9 +189,18 @@ class CourseSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(e.message)
         return value
 
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_lessons_count(self, obj):
+        """Количество уроков (из аннотации queryset, если она есть)"""
+        if hasattr(obj, 'lessons_count'):
+            return obj.lessons_count
+        return obj.lessons.count()
+
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_subscribed(self, obj):
         """Определяет, подписан ли текущий пользователь на курс"""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(
@@ -83,6 +223,15 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class TombstoneSerializer(serializers.ModelSerializer):
+    """Удаленный курс или урок в ленте синхронизации"""
+    id = serializers.IntegerField(source='object_id')
+
+    class Meta:
+        model = Tombstone
+        fields = ('id', 'course_id', 'deleted_at')
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Payment из users.models"""
 
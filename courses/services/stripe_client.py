@@ -0,0 +1,132 @@
+# courses/services/stripe_client.py
+import logging
+import math
+import threading
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Число подряд идущих сбоев Stripe (таймауты, 5xx, 429)
+BREAKER_FAILURES_KEY = 'stripe_breaker:failures'
+# Признак разомкнутого предохранителя: пока ключ жив, Stripe не вызываем
+BREAKER_OPEN_KEY = 'stripe_breaker:open'
+# Пробный вызов после паузы уже выполняется
+BREAKER_PROBE_KEY = 'stripe_breaker:probe'
+
+# Наибольшая пауза между повторами запроса (секунды); Retry-After длиннее не соблюдается
+MAX_RETRY_DELAY = 5
+
+# Ошибки, говорящие о недоступности Stripe, а не о неверном запросе
+TRANSIENT_ERRORS = (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError)
+
+_local = threading.local()
+
+
+class StripeUnavailable(stripe.error.StripeError):
+    """Stripe временно не вызывается: предохранитель разомкнут"""
+
+
+class _RequestsClient(stripe.RequestsClient):
+    """HTTP-клиент Stripe с паузой между повторами не дольше MAX_RETRY_DELAY"""
+
+    def _sleep_time_seconds(self, num_retries, response=None):
+        # stripe-python ждет по заголовку Retry-After до 60 с: вызов вышел бы за get_call_budget()
+        return min(super()._sleep_time_seconds(num_retries, response), MAX_RETRY_DELAY)
+
+
+def _build_client():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    http_client = _RequestsClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        session=session,
+    )
+    # STRIPE_API_BASE направляет клиент на локальную замену Stripe (users/fake_stripe.py)
+    base_addresses = {'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE else None
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        http_client=http_client,
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        base_addresses=base_addresses,
+    )
+
+
+def get_stripe_client():
+    """
+    Общий клиент Stripe для всех платежных операций.
+
+    У каждого потока свой клиент с keep-alive пулом соединений
+    (requests.Session не потокобезопасна) и таймаутами на соединение и
+    чтение ответа. Сетевые ошибки, 409 и 5xx повторяются не более
+    STRIPE_MAX_NETWORK_RETRIES раз с экспоненциальной задержкой и
+    случайным разбросом; POST-запросы без явного ключа идемпотентности
+    получают его автоматически, и повтор не создает дубликат.
+    """
+    clients = getattr(_local, 'clients', None)
+    if clients is None:
+        clients = _local.clients = {}
+    key = (settings.STRIPE_SECRET_KEY, settings.STRIPE_API_BASE)
+    if key not in clients:
+        clients[key] = _build_client()
+    return clients[key]
+
+
+def get_call_budget():
+    """
+    Наибольшая длительность одного вызова Stripe (секунды): все попытки
+    до таймаутов соединения и чтения плюс паузы между повторами (не длиннее
+    MAX_RETRY_DELAY, см. _RequestsClient)
+    """
+    attempts = settings.STRIPE_MAX_NETWORK_RETRIES + 1
+    return (attempts * (settings.STRIPE_CONNECT_TIMEOUT + settings.STRIPE_READ_TIMEOUT)
+            + settings.STRIPE_MAX_NETWORK_RETRIES * MAX_RETRY_DELAY)
+
+
+def call_stripe(method, *args, **kwargs):
+    """
+    Вызывает метод клиента Stripe через предохранитель.
+
+    После STRIPE_BREAKER_THRESHOLD сбоев (за STRIPE_BREAKER_RESET_TIMEOUT * 10
+    секунд) предохранитель размыкается на STRIPE_BREAKER_RESET_TIMEOUT
+    секунд: вызовы сразу завершаются StripeUnavailable, не занимая воркер
+    ожиданием таймаутов. Затем к Stripe пропускается один пробный вызов,
+    остальные до его завершения получают StripeUnavailable. Успешная проба
+    замыкает предохранитель и сбрасывает счетчик, неудачная размыкает снова.
+    """
+    state = cache.get_many([BREAKER_OPEN_KEY, BREAKER_FAILURES_KEY])
+    if state.get(BREAKER_OPEN_KEY):
+        raise StripeUnavailable("Stripe временно недоступен, повторите попытку позже")
+
+    probe = state.get(BREAKER_FAILURES_KEY, 0) >= settings.STRIPE_BREAKER_THRESHOLD
+    if probe and not cache.add(BREAKER_PROBE_KEY, 1, timeout=math.ceil(get_call_budget())):
+        raise StripeUnavailable("Stripe временно недоступен, повторите попытку позже")
+
+    try:
+        result = method(*args, **kwargs)
+    except TRANSIENT_ERRORS:
+        _record_failure()
+        raise
+    else:
+        if probe:
+            cache.delete(BREAKER_FAILURES_KEY)
+            logger.info("Stripe: пробный вызов успешен, вызовы возобновлены")
+    finally:
+        if probe:
+            cache.delete(BREAKER_PROBE_KEY)
+    return result
+
+
+def _record_failure():
+    cache.add(BREAKER_FAILURES_KEY, 0, timeout=settings.STRIPE_BREAKER_RESET_TIMEOUT * 10)
+    failures = cache.incr(BREAKER_FAILURES_KEY)
+    if failures >= settings.STRIPE_BREAKER_THRESHOLD:
+        if cache.add(BREAKER_OPEN_KEY, 1, timeout=settings.STRIPE_BREAKER_RESET_TIMEOUT):
+            logger.error(f"Stripe: {failures} сбоев, вызовы приостановлены "
+                         f"на {settings.STRIPE_BREAKER_RESET_TIMEOUT} с")
@@ -0,0 +1,86 @@
+# courses/services/stripe_registry.py
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from ..cache import invalidate_course
+from ..models import Course
+from .stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
+
+# Версия цены - сумма в копейках: при смене цены ключ меняется сам
+PRICE_CACHE_KEY = 'stripe_price:{model}:{pk}:{amount}'
+
+
+def _amount_in_cents(amount):
+    return int(amount * 100)
+
+
+def get_stripe_price_id(item, currency='rub'):
+    """
+    ID цены Stripe для текущей цены курса или урока.
+
+    Продукт создается в Stripe один раз на объект, цена - один раз на
+    каждую версию цены; их ID сохраняются в stripe_product_id,
+    stripe_price_id и stripe_price_amount объекта и кешируются. Обычная
+    покупка не обращается к Stripe вовсе, поэтому при оформлении заказа
+    остается один вызов - создание сессии оплаты.
+    """
+    model = type(item)
+    model_name = model._meta.model_name
+    key = PRICE_CACHE_KEY.format(model=model_name, pk=item.pk, amount=_amount_in_cents(item.price))
+    price_id = cache.get(key)
+    if price_id:
+        return price_id
+
+    if item.stripe_price_id and item.stripe_price_amount == item.price:
+        cache.set(key, item.stripe_price_id, settings.STRIPE_PRICE_CACHE_TIMEOUT)
+        return item.stripe_price_id
+
+    # Вызовы Stripe идут вне транзакции и без блокировки строки: медленный
+    # ответ не задерживает запись курса. Параллельные покупки передают
+    # одинаковые ключи идемпотентности и получают от Stripe те же объекты
+    current = model.objects.get(pk=item.pk)
+    amount = _amount_in_cents(current.price)
+    prefix = settings.STRIPE_IDEMPOTENCY_PREFIX
+    if not (current.stripe_price_id and current.stripe_price_amount == current.price):
+        if not current.stripe_product_id:
+            product = StripeService.create_product(
+                name=current.title,
+                description=f"Оплата за {model_name}: {current.title}",
+                metadata={'type': model_name, f'{model_name}_id': str(current.pk)},
+                idempotency_key=f'{prefix}-product-{model_name}-{current.pk}',
+            )
+            current.stripe_product_id = product.id
+            # Продукт сохраняется сразу и без условия по цене: повтор с тем же
+            # ключом идемпотентности, но другими параметрами Stripe отклонит
+            model.objects.filter(pk=current.pk).update(stripe_product_id=product.id)
+        price = StripeService.create_price(
+            product_id=current.stripe_product_id,
+            amount=current.price,
+            currency=currency,
+            idempotency_key=f'{prefix}-price-{model_name}-{current.pk}-{amount}-{currency}',
+        )
+        current.stripe_price_id = price.id
+        current.stripe_price_amount = current.price
+        # update() вместо save(): покупка не должна менять updated_at курса.
+        # Условие по цене: если цену успели изменить, ID не сохраняются
+        updated = model.objects.filter(pk=current.pk, price=current.price).update(
+            stripe_price_id=current.stripe_price_id,
+            stripe_price_amount=current.stripe_price_amount,
+        )
+        if updated:
+            # update() не вызывает сигналы: кеш ответов и ETag сбрасываем сами
+            invalidate_course(current.pk if model is Course else current.course_id)
+            logger.info(f"Созданы Stripe ID для {model_name} {current.pk}: price={price.id}")
+
+    item.stripe_product_id = current.stripe_product_id
+    item.stripe_price_id = current.stripe_price_id
+    item.stripe_price_amount = current.stripe_price_amount
+    cache.set(
+        PRICE_CACHE_KEY.format(model=model_name, pk=item.pk, amount=amount),
+        current.stripe_price_id,
+        settings.STRIPE_PRICE_CACHE_TIMEOUT,
+    )
+    return current.stripe_price_id
@@ -1,21 +1,29 @@
 ﻿import stripe
-from django.conf import settings
 import logging
 
+from .stripe_client import call_stripe, get_stripe_client
+
 logger = logging.getLogger(__name__)
-stripe.api_key = settings.STRIPE_SECRET_KEY
+
+
+def _options(idempotency_key):
+    return {'idempotency_key': idempotency_key} if idempotency_key else None
 
 class StripeService:
     """Сервис для работы с платежами Stripe"""
     
     @staticmethod
-    def create_product(name, description=None):
+    def create_product(name, description=None, metadata=None, idempotency_key=None):
         """Создание продукта в Stripe"""
         try:
-            product = stripe.Product.create(
-                name=name,
-                description=description or name,
-                metadata={'type': 'course'}
+            product = call_stripe(
+                get_stripe_client().v1.products.create,
+                params={
+                    'name': name,
+                    'description': description or name,
+                    'metadata': metadata or {'type': 'course'},
+                },
+                options=_options(idempotency_key),
             )
             return product
         except stripe.error.StripeError as e:
@@ -23,16 +31,20 @@ class StripeService:
             raise
     
     @staticmethod
-    def create_price(product_id, amount, currency='rub'):
+    def create_price(product_id, amount, currency='rub', idempotency_key=None):
         """Создание цены в Stripe"""
         try:
             # онвертируем в центы/копейки
             amount_in_cents = int(amount * 100)
             
-            price = stripe.Price.create(
-                unit_amount=amount_in_cents,
-                currency=currency.lower(),
-                product=product_id,
+            price = call_stripe(
+                get_stripe_client().v1.prices.create,
+                params={
+                    'unit_amount': amount_in_cents,
+                    'currency': currency.lower(),
+                    'product': product_id,
+                },
+                options=_options(idempotency_key),
             )
             return price
         except stripe.error.StripeError as e:
@@ -41,23 +53,27 @@ class StripeService:
     
     @staticmethod
     def create_checkout_session(price_id, user_id, item_id, item_type='course', 
-                                success_url=None, cancel_url=None):
+                                success_url=None, cancel_url=None, idempotency_key=None):
         """Создание сессии для оплаты"""
         try:
-            session = stripe.checkout.Session.create(
-                line_items=[{
-                    'price': price_id,
-                    'quantity': 1,
-                }],
-                mode='payment',
-                success_url=success_url or f'http://localhost:8000/api/users/payments/success/?session_id={{CHECKOUT_SESSION_ID}}',
-                cancel_url=cancel_url or 'http://localhost:8000/api/users/payments/cancel/',
-                metadata={
-                    'user_id': str(user_id),
-                    'item_id': str(item_id),
-                    'item_type': item_type,
+            session = call_stripe(
+                get_stripe_client().v1.checkout.sessions.create,
+                params={
+                    'line_items': [{
+                        'price': price_id,
+                        'quantity': 1,
+                    }],
+                    'mode': 'payment',
+                    'success_url': success_url or f'http://localhost:8000/api/users/payments/success/?session_id={{CHECKOUT_SESSION_ID}}',
+                    'cancel_url': cancel_url or 'http://localhost:8000/api/users/payments/cancel/',
+                    'metadata': {
+                        'user_id': str(user_id),
+                        'item_id': str(item_id),
+                        'item_type': item_type,
+                    },
+                    'payment_method_types': ['card'],
                 },
-                payment_method_types=['card'],
+                options=_options(idempotency_key),
             )
             return session
         except stripe.error.StripeError as e:
@@ -68,8 +84,28 @@ class StripeService:
     def retrieve_session(session_id):
         """олучение информации о сессии"""
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = call_stripe(get_stripe_client().v1.checkout.sessions.retrieve, session_id)
             return session
         except stripe.error.StripeError as e:
             logger.error(f"Ошибка получения сессии Stripe: {e}")
             raise
+
+    @staticmethod
+    def list_sessions(created_after, page_size=100):
+        """
+        Сессии оплаты, созданные после created_after (постраничный обход).
+
+        Страницы запрашиваются по одной по мере итерации; каждая идет через
+        предохранитель (auto_paging_iter запрашивал бы следующие страницы в обход него)
+        """
+        params = {'created': {'gte': int(created_after.timestamp())}, 'limit': page_size}
+        while True:
+            try:
+                page = call_stripe(get_stripe_client().v1.checkout.sessions.list, params=params)
+            except stripe.error.StripeError as e:
+                logger.error(f"Ошибка получения списка сессий Stripe: {e}")
+                raise
+            yield from page.data
+            if not page.has_more or not page.data:
+                return
+            params = {**params, 'starting_after': page.data[-1].id}
@@ -0,0 +1,53 @@
+# courses/services/stripe_sessions.py
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .stripe_client import StripeUnavailable, get_call_budget
+from .stripe_service import StripeService
+
+SESSION_CACHE_KEY = 'stripe_session:{session_id}'
+# Запрос к Stripe за этой сессией уже выполняется
+SESSION_LOCK_KEY = 'stripe_session:{session_id}:lock'
+# Как часто ожидающий запрос проверяет, не появилась ли сессия в кеше (секунды)
+SESSION_POLL_INTERVAL = 0.05
+
+
+def get_checkout_session(session_id):
+    """
+    Сессия Checkout для опроса статуса оплаты.
+
+    Ответ Stripe кешируется на STRIPE_SESSION_CACHE_TTL секунд. Если сессии
+    нет в кеше, в Stripe идет только один запрос: остальные опрашивающие ту
+    же сессию ждут его результата в кеше. Если этот запрос завершился
+    ошибкой, его место занимает следующий ожидающий.
+
+    Блокировка живет не меньше наибольшей длительности вызова Stripe с
+    повторами, поэтому не истекает, пока запрос еще выполняется. Ожидание
+    ограничено STRIPE_SESSION_WAIT_TIMEOUT: затем StripeUnavailable, чтобы
+    медленный Stripe не занимал воркеры опросом кеша.
+    """
+    key = SESSION_CACHE_KEY.format(session_id=session_id)
+    lock_key = SESSION_LOCK_KEY.format(session_id=session_id)
+    deadline = time.monotonic() + settings.STRIPE_SESSION_WAIT_TIMEOUT
+    while True:
+        session = cache.get(key)
+        if session is not None:
+            return session
+        if cache.add(lock_key, 1, timeout=math.ceil(get_call_budget())):
+            try:
+                session = StripeService.retrieve_session(session_id)
+                cache.set(key, session, settings.STRIPE_SESSION_CACHE_TTL)
+                return session
+            finally:
+                cache.delete(lock_key)
+        if time.monotonic() >= deadline:
+            raise StripeUnavailable("Stripe не ответил вовремя, повторите попытку позже")
+        time.sleep(SESSION_POLL_INTERVAL)
+
+
+def invalidate_sessions(session_ids):
+    """Сбрасывает закешированные сессии: их состояние изменилось (вебхук)"""
+    cache.delete_many([SESSION_CACHE_KEY.format(session_id=session_id) for session_id in session_ids])
@@ -0,0 +1,70 @@
+# courses/sync.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_filters.utils import translate_validation
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
+from drf_spectacular.types import OpenApiTypes
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from users.roles import is_moderator
+from .filters import TombstoneFilter
+from .models import Tombstone
+from .paginators import TombstoneCursorPagination
+from .serializers import TombstoneSerializer
+
+
+class TombstoneFeedMixin:
+    """
+    Лента удаленных объектов для инкрементальной синхронизации.
+
+    Клиент запрашивает список с ?updated_since=<время прошлой синхронизации>
+    и /deleted/ с тем же параметром, после чего применяет изменения и
+    удаления к локальной копии вместо загрузки всего каталога. Отметки об
+    удалении хранятся TOMBSTONE_RETENTION_DAYS дней: на более ранний
+    updated_since /deleted/ отвечает 410, и клиент синхронизируется заново целиком.
+    """
+    tombstone_model_name = None
+
+    def get_tombstone_queryset(self):
+        queryset = Tombstone.objects.filter(model_name=self.tombstone_model_name)
+        user = self.request.user
+        if not (user.is_superuser or is_moderator(self.request)):
+            queryset = queryset.filter(owner_id=user.pk)
+        return queryset
+
+    @extend_schema(
+        summary="Удаленные объекты",
+        description="Лента удалений для инкрементальной синхронизации (keyset-пагинация по времени удаления)",
+        parameters=[
+            OpenApiParameter(
+                name='updated_since',
+                type=OpenApiTypes.DATETIME,
+                location=OpenApiParameter.QUERY,
+                description='Только объекты, удаленные начиная с этого момента'
+            )
+        ],
+        responses={
+            200: TombstoneSerializer(many=True),
+            410: OpenApiResponse(description='updated_since старше срока хранения удалений: нужна полная синхронизация'),
+        },
+    )
+    @action(detail=False, methods=['get'], url_path='deleted')
+    def deleted(self, request):
+        filterset = TombstoneFilter(request.query_params, queryset=self.get_tombstone_queryset(), request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+
+        since = filterset.form.cleaned_data.get('updated_since')
+        if since and since < timezone.now() - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS):
+            return Response(
+                {'detail': 'Удаления за этот период уже не хранятся, загрузите данные заново', 'full_resync': True},
+                status=status.HTTP_410_GONE,
+            )
+
+        paginator = TombstoneCursorPagination()
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        return paginator.get_paginated_response(TombstoneSerializer(page, many=True).data)
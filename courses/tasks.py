@@ -1,67 +1,333 @@
 # courses/tasks.py
-from celery import shared_task
-from django.core.mail import send_mail
+import logging
+from itertools import islice
+
+from celery import chord, shared_task
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
 from django.utils import timezone
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from .models import Course, Subscription
+from .models import Course, DigestEntry, NotificationDelivery, Subscription, Tombstone
+from .notifications import (
+    build_update_message, record_digest_updates, relay_outbox, release_course_changes, take_course_changes,
+)
+from users.tasks import block_inactive_users
 from datetime import timedelta
 
-User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def iter_chunks(iterable, size):
+    """Разбивает поток на списки не длиннее size"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def build_course_update_message(course, recipient, update_message):
+    """Письмо подписчику об обновлении курса"""
+    email, first_name = recipient
+    subject = f'Обновление курса: {course.title}'
+    message = f'''
+            Здравствуйте, {first_name or email}!
+
+            Курс "{course.title}" был обновлен.
+
+            {update_message}
+
+            С уважением,
+            Команда обучающей платформы
+            '''
+    return EmailMessage(subject=subject, body=message, from_email=settings.DEFAULT_FROM_EMAIL, to=[email])
+
+
+def send_messages_each(messages):
+    """
+    Отправляет письма через одно SMTP-соединение и возвращает признак
+    доставки каждого письма (в том же порядке).
+    """
+    # fail_silently: ошибка одного письма не должна срывать всю пачку
+    with get_connection(fail_silently=True) as smtp:
+        return [bool(smtp.send_messages([message])) for message in messages]
+
+
+def send_course_update_chunk(course, recipients, update_message):
+    """
+    Отправляет письма пачке подписчиков через одно SMTP-соединение.
+    Возвращает признак доставки каждому получателю.
+    """
+    return send_messages_each(
+        [build_course_update_message(course, recipient, update_message) for recipient in recipients]
+    )
+
+
+def active_subscriptions(course_id):
+    """Подписчики, получающие письмо сразу (без режима сводки)"""
+    return Subscription.objects.filter(course_id=course_id, is_active=True, digest=False)
+
+
+def subscriber_id_ranges(course_id, chunk_size):
+    """
+    Делит активные подписки курса на диапазоны id по chunk_size штук:
+    [(start, end), ...], end не включается. Последний диапазон открыт
+    справа (end=None), чтобы захватить подписки, появившиеся позже.
+    Читаются только id по индексу (course, id).
+    """
+    ids = active_subscriptions(course_id).order_by('id').values_list('id', flat=True).iterator(chunk_size=10000)
+    starts = [subscription_id for number, subscription_id in enumerate(ids) if number % chunk_size == 0]
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def claim_deliveries(notification_key, chunk):
+    """
+    Отбирает из пачки [(user_id, email, first_name), ...] получателей, которым
+    уведомление с этим ключом еще не отправлялось, и отмечает их в
+    NotificationDelivery. Возвращает (получатели, ключи отметок).
+    """
+    recipients = {f'{notification_key}:{user_id}': (email, first_name) for user_id, email, first_name in chunk}
+    if not recipients:
+        return [], []
+    # Получатели определяются тем, что реально вставила эта вставка: две
+    # параллельные копии задачи не могут отметить одного получателя обе
+    table = connection.ops.quote_name(NotificationDelivery._meta.db_table)
+    key_column = connection.ops.quote_name('key')
+    created_column = connection.ops.quote_name('created_at')
+    now = timezone.now()
+    values = ', '.join(['(%s, %s)'] * len(recipients))
+    params = [value for key in recipients for value in (key, now)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({key_column}, {created_column}) VALUES {values} '
+            f'ON CONFLICT ({key_column}) DO NOTHING RETURNING {key_column}',
+            params,
+        )
+        claimed = {row[0] for row in cursor.fetchall()}
+    keys = [key for key in recipients if key in claimed]
+    return [recipients[key] for key in keys], keys
+
+
+def send_course_update_range(course, update_message, start_id, end_id, chunk_size, notification_key=None):
+    """
+    Рассылка подписчикам из диапазона id: (доставлено, не доставлено).
+    С notification_key каждый получатель отмечается перед отправкой, и
+    повтор рассылки с тем же ключом его пропускает.
+    """
+    subscriptions = active_subscriptions(course.id).filter(id__gte=start_id)
+    if end_id is not None:
+        subscriptions = subscriptions.filter(id__lt=end_id)
+    recipients = subscriptions.order_by('id').values_list(
+        'user_id', 'user__email', 'user__first_name'
+    ).iterator(chunk_size=chunk_size)
+
+    sent = failed = 0
+    for chunk in iter_chunks(recipients, chunk_size):
+        if notification_key:
+            chunk, keys = claim_deliveries(notification_key, chunk)
+        else:
+            chunk, keys = [(email, first_name) for _, email, first_name in chunk], []
+        if not chunk:
+            continue
+        delivered = send_course_update_chunk(course, chunk, update_message)
+        failed_keys = [key for key, ok in zip(keys, delivered) if not ok]
+        if failed_keys:
+            # Снимаем отметки недоставленных писем, чтобы повтор задачи отправил их снова
+            NotificationDelivery.objects.filter(key__in=failed_keys).delete()
+        chunk_sent = sum(delivered)
+        sent += chunk_sent
+        failed += len(delivered) - chunk_sent
+    return sent, failed
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_course_update_email_chunk(self, course_id, update_message, start_id, end_id, notification_key=None):
+    """
+    Часть распределенной рассылки: подписчики курса с id в [start_id, end_id).
+
+    Повторяется сама по себе, если не ушло ни одного письма (например,
+    недоступен SMTP). Частичные ошибки не повторяются, чтобы не отправлять
+    письма дважды, а попадают в счетчик failed. Повторная доставка той же
+    задачи брокером пропускает получателей, уже отмеченных по notification_key.
+    """
+    try:
+        course = Course.objects.get(id=course_id)
+    except Course.DoesNotExist:
+        return {'sent': 0, 'failed': 0}
+
+    sent, failed = send_course_update_range(
+        course, update_message, start_id, end_id, settings.COURSE_UPDATE_EMAIL_CHUNK_SIZE, notification_key
+    )
+    if failed and not sent and self.request.retries < self.max_retries:
+        raise self.retry()
+    return {'sent': sent, 'failed': failed}
 
 
 @shared_task
-def send_course_update_email(course_id, update_message):
+def record_course_update_totals(results, course_id):
+    """Завершение распределенной рассылки: суммирует результаты частей"""
+    totals = {
+        'course_id': course_id,
+        'sent': sum(result['sent'] for result in results),
+        'failed': sum(result['failed'] for result in results),
+        'chunks': len(results),
+    }
+    logger.info(
+        f"Курс {course_id}: рассылка завершена, доставлено {totals['sent']}, "
+        f"не доставлено {totals['failed']}, частей {totals['chunks']}"
+    )
+    return totals
+
+
+@shared_task
+def send_course_update_email(course_id, update_message, notification_key=None):
     """
-    Отправляет email пользователям об обновлении курса
+    Отправляет email пользователям об обновлении курса.
+
+    Подписчики делятся на диапазоны id по COURSE_UPDATE_EMAIL_CHUNK_SIZE.
+    Если диапазон один, письма отправляются сразу в этой задаче; иначе
+    запускается chord из задач по диапазонам, которые выполняются на разных
+    воркерах, а record_course_update_totals подводит итог. Внутри диапазона
+    подписчики читаются потоком, пачка уходит через одно SMTP-соединение.
+    Подписчикам в режиме сводки курс только отмечается для
+    send_course_update_digests. notification_key делает рассылку
+    идемпотентной: каждый получатель получит письмо с этим ключом один раз.
     """
     try:
         course = Course.objects.get(id=course_id)
-        subscribers = Subscription.objects.filter(
-            course=course,
-            is_active=True
-        ).select_related('user')
+    except Course.DoesNotExist:
+        return {'course_id': course_id, 'sent': 0, 'failed': 0, 'error': f"Курс с id {course_id} не найден"}
 
-        for subscription in subscribers:
-            subject = f'Обновление курса: {course.title}'
-            message = f'''
-            Здравствуйте, {subscription.user.username}!
+    chunk_size = settings.COURSE_UPDATE_EMAIL_CHUNK_SIZE
+    record_digest_updates(course_id, chunk_size)
+    ranges = subscriber_id_ranges(course_id, chunk_size)
+    if len(ranges) > 1:
+        chord(
+            send_course_update_email_chunk.s(course_id, update_message, start_id, end_id, notification_key)
+            for start_id, end_id in ranges
+        )(record_course_update_totals.s(course_id))
+        return {'course_id': course_id, 'chunks': len(ranges)}
 
-            Курс "{course.title}" был обновлен.
+    sent = failed = 0
+    if ranges:
+        sent, failed = send_course_update_range(course, update_message, *ranges[0], chunk_size, notification_key)
+    if failed:
+        logger.warning(f"Курс {course_id}: не доставлено {failed} писем об обновлении")
+    return {'course_id': course_id, 'sent': sent, 'failed': failed}
+
+
+@shared_task
+def relay_notification_outbox():
+    """
+    Ретранслятор NotificationOutbox (CELERY_BEAT_SCHEDULE): передает в
+    рассылку курсы с истекшим окном уведомлений пачками по
+    NOTIFICATION_OUTBOX_BATCH_SIZE, пока такие курсы не закончатся.
+    """
+    batch_size = settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    relayed = 0
+    while True:
+        count = relay_outbox(batch_size)
+        relayed += count
+        if count < batch_size:
+            return relayed
+
+
+@shared_task
+def prune_notification_deliveries():
+    """Удаляет отметки об отправке старше NOTIFICATION_DELIVERY_RETENTION_DAYS"""
+    threshold = timezone.now() - timedelta(days=settings.NOTIFICATION_DELIVERY_RETENTION_DAYS)
+    deleted, _ = NotificationDelivery.objects.filter(created_at__lt=threshold).delete()
+    return deleted
 
-            {update_message}
+
+@shared_task
+def prune_tombstones():
+    """Удаляет отметки об удалении старше TOMBSTONE_RETENTION_DAYS"""
+    threshold = timezone.now() - timedelta(days=settings.TOMBSTONE_RETENTION_DAYS)
+    # model_name в условии - чтобы удаление шло по индексу (model_name, deleted_at)
+    model_names = [model_name for model_name, _ in Tombstone.MODEL_CHOICES]
+    deleted, _ = Tombstone.objects.filter(model_name__in=model_names, deleted_at__lt=threshold).delete()
+    return deleted
+
+
+@shared_task
+def send_pending_course_update(course_id, last_id):
+    """
+    Отправляет одно уведомление по правкам курса, накопленным за окно
+    COURSE_UPDATE_NOTIFY_WINDOW (см. courses.notifications.relay_outbox).
+    События удаляются из outbox только после отправки: если задача
+    прервется, ретранслятор передаст их заново, и рассылка с тем же
+    ключом уведомления дошлет письма только недополучившим.
+    """
+    lessons, course_changed, notification_key = take_course_changes(course_id, last_id)
+    if notification_key is None:
+        return {'course_id': course_id, 'sent': 0, 'failed': 0, 'lessons': []}
+
+    result = send_course_update_email(course_id, build_update_message(lessons, course_changed), notification_key)
+    release_course_changes(course_id, last_id)
+    result['lessons'] = [lesson_id for lesson_id, _ in lessons]
+    return result
+
+
+def build_digest_message(recipient, course_titles):
+    """Сводка подписчику: все курсы, обновленные за период"""
+    email, first_name = recipient
+    courses = '\n'.join(f'            - {title}' for title in course_titles)
+    subject = f'Обновления курсов: {len(course_titles)}'
+    message = f'''
+            Здравствуйте, {first_name or email}!
+
+            За последнее время обновлены курсы, на которые вы подписаны:
+{courses}
 
             С уважением,
             Команда обучающей платформы
             '''
+    return EmailMessage(subject=subject, body=message, from_email=settings.DEFAULT_FROM_EMAIL, to=[email])
 
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[subscription.user.email],
-                fail_silently=False,
-            )
 
-        return f"Письма отправлены {subscribers.count()} подписчикам курса {course.title}"
+@shared_task
+def send_course_update_digests():
+    """
+    Периодическая сводка (CELERY_BEAT_SCHEDULE): одно письмо на
+    пользователя со всеми курсами, обновленными с прошлой сводки.
 
-    except Course.DoesNotExist:
-        return f"Курс с id {course_id} не найден"
+    Пользователи обрабатываются пачками по COURSE_UPDATE_EMAIL_CHUNK_SIZE,
+    письма пачки уходят через одно SMTP-соединение. Удаляются только
+    записи, обновленные до начала прогона, поэтому обновление курса во
+    время отправки попадет в следующую сводку.
+    """
+    started = timezone.now()
+    chunk_size = settings.COURSE_UPDATE_EMAIL_CHUNK_SIZE
+    pending = DigestEntry.objects.filter(updated_at__lte=started)
+    user_ids = pending.order_by('user_id').values_list('user_id', flat=True).distinct().iterator(chunk_size=chunk_size)
+
+    sent = failed = 0
+    for chunk in iter_chunks(user_ids, chunk_size):
+        entries = pending.filter(user_id__in=chunk).order_by('user_id', 'course__title').values_list(
+            'user_id', 'user__email', 'user__first_name', 'course__title'
+        )
+        digests = {}
+        for user_id, email, first_name, title in entries:
+            digests.setdefault((user_id, email, first_name), []).append(title)
+        delivered = send_messages_each(
+            [build_digest_message((email, first_name), titles) for (_, email, first_name), titles in digests.items()]
+        )
+        # Недоставленные сводки (например, недоступен SMTP) остаются до следующего запуска
+        delivered_ids = [user_id for (user_id, _, _), ok in zip(digests, delivered) if ok]
+        if delivered_ids:
+            pending.filter(user_id__in=delivered_ids).delete()
+        chunk_sent = len(delivered_ids)
+        sent += chunk_sent
+        failed += len(delivered) - chunk_sent
+
+    if failed:
+        logger.warning(f"Сводка обновлений курсов: не доставлено {failed} писем")
+    return {'sent': sent, 'failed': failed}
 
 
 @shared_task
 def check_inactive_users():
     """
-    Проверяет пользователей, которые не заходили более месяца,
-    и блокирует их (устанавливает is_active=False)
+    Прежнее имя users.tasks.block_inactive_users для уже поставленных задач
+    и расписаний: запускает ту же блокировку с той же позицией
     """
-    one_month_ago = timezone.now() - timedelta(days=30)
-    inactive_users = User.objects.filter(
-        last_login__lt=one_month_ago,
-        is_active=True
-    )
-
-    count = inactive_users.count()
-    inactive_users.update(is_active=False)
-
-    return f"Заблокировано {count} неактивных пользователей"
+    return block_inactive_users()
@@ -1,9 +1,24 @@
-﻿from django.test import TestCase
+﻿from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import get_connection
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from courses.models import Course, Lesson, Subscription
+from django.utils import timezone
+from courses.models import Course, DigestEntry, Lesson, NotificationDelivery, NotificationOutbox, Subscription
+from courses.tasks import (
+    relay_notification_outbox, send_course_update_digests, send_course_update_email, send_pending_course_update,
+    subscriber_id_ranges,
+)
+from config.celery import app as celery_app
 from django.core.exceptions import ValidationError
 from courses.validators import validate_youtube_url, validate_no_external_links
 
@@ -473,4 +488,903 @@ class ValidatorAPITests(APITestCase):
 
         # Должен быть успех (201 Created)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['video_url'], 'https://youtube.com/watch?v=abc123')
\ No newline at end of file
+        self.assertEqual(response.data['video_url'], 'https://youtube.com/watch?v=abc123')
+
+
+class CourseQueryCountTests(APITestCase):
+    """Тесты количества SQL-запросов при выдаче списка курсов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='querycount@example.com',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _create_courses(self, count):
+        for index in range(count):
+            course = Course.objects.create(
+                title=f'Курс {index}',
+                description='Описание курса',
+                owner=self.user
+            )
+            Lesson.objects.create(
+                title=f'Урок {index}',
+                description='Описание урока',
+                video_url='https://youtube.com/watch?v=abc123',
+                course=course,
+                owner=self.user
+            )
+            Subscription.objects.create(user=self.user, course=course)
+
+    def _list_queries(self):
+        # Измеряем запросы без кеша ответов
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/courses/courses/', {'page_size': 50, 'expand': 'lessons'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(context.captured_queries)
+
+    def test_course_list_query_count_is_constant(self):
+        """Тест: число запросов не зависит от количества курсов на странице"""
+        self._create_courses(2)
+        # Первый запрос прогревает кеш ролей пользователя
+        self._list_queries()
+        _, small_page_queries = self._list_queries()
+
+        self._create_courses(8)
+        response, large_page_queries = self._list_queries()
+
+        self.assertEqual(small_page_queries, large_page_queries)
+        self.assertEqual(len(response.data['results']), 10)
+        for course in response.data['results']:
+            self.assertEqual(course['lessons_count'], 1)
+            self.assertEqual(len(course['lessons']), 1)
+            self.assertTrue(course['is_subscribed'])
+
+
+class CursorPaginationTests(APITestCase):
+    """Тесты keyset-пагинации (?pagination=cursor)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='cursor@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Курс для пагинации',
+            description='Описание курса',
+            owner=self.user
+        )
+        for index in range(12):
+            Lesson.objects.create(
+                title=f'Урок {index}',
+                description='Описание урока',
+                video_url='https://youtube.com/watch?v=abc123',
+                course=self.course,
+                owner=self.user
+            )
+        self.client.force_authenticate(user=self.user)
+
+    def test_lessons_cursor_pagination_walks_all_pages(self):
+        """Тест: курсорная пагинация обходит все уроки без COUNT и повторов"""
+        response = self.client.get('/api/courses/lessons/', {'pagination': 'cursor', 'page_size': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+
+        seen_ids = [lesson['id'] for lesson in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen_ids.extend(lesson['id'] for lesson in response.data['results'])
+            next_url = response.data['next']
+
+        expected_ids = list(Lesson.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(seen_ids, expected_ids)
+
+    def test_cursor_is_keyset_on_created_at_and_id(self):
+        """Тест: уроки с одинаковым created_at не теряются и не повторяются, ?ordering= не меняет порядок"""
+        Lesson.objects.update(created_at=timezone.now())
+        response = self.client.get('/api/courses/lessons/', {'pagination': 'cursor', 'page_size': 5, 'ordering': '-title'})
+
+        seen_ids = [lesson['id'] for lesson in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen_ids.extend(lesson['id'] for lesson in response.data['results'])
+        self.assertEqual(seen_ids, sorted(Lesson.objects.values_list('id', flat=True)))
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([lesson['id'] for lesson in previous.data['results']], seen_ids[5:10])
+
+    def test_page_number_pagination_is_default(self):
+        """Тест: без параметра используется пагинация по номерам страниц"""
+        response = self.client.get('/api/courses/lessons/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 12)
+
+
+class FullTextSearchTests(APITestCase):
+    """Тесты полнотекстового поиска по курсам"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='search@example.com',
+            password='testpass123'
+        )
+        self.description_match = Course.objects.create(
+            title='Основы разработки',
+            description='Курс о программировании для начинающих',
+            owner=self.user
+        )
+        self.title_match = Course.objects.create(
+            title='Программирование на Python',
+            description='Переменные, функции и классы',
+            owner=self.user
+        )
+        Course.objects.create(
+            title='Рисование акварелью',
+            description='Кисти и краски',
+            owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_search_uses_russian_morphology_and_rank(self):
+        """Тест: поиск учитывает словоформы и ставит совпадение в названии выше"""
+        response = self.client.get('/api/courses/courses/', {'search': 'программированию'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        found_ids = [course['id'] for course in response.data['results']]
+        self.assertEqual(found_ids, [self.title_match.id, self.description_match.id])
+        self.assertNotIn('search_vector', response.data['results'][0])
+
+
+class RoleResolverTests(APITestCase):
+    """Тесты вычисления ролей пользователя"""
+
+    def setUp(self):
+        self.moderator_group, _ = Group.objects.get_or_create(name='moderators')
+        self.user = User.objects.create_user(
+            email='roles@example.com',
+            password='testpass123'
+        )
+        self.owner = User.objects.create_user(
+            email='roles-owner@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Чужой курс',
+            description='Описание курса',
+            owner=self.owner
+        )
+
+    def test_roles_are_resolved_once_per_request(self):
+        """Тест: роли вычисляются одним запросом, даже при составных правах"""
+        from users.roles import get_user_roles
+
+        self.user.groups.add(self.moderator_group)
+        user = User.objects.get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as context:
+            for _ in range(3):
+                self.assertIn('moderators', get_user_roles(user))
+        self.assertLessEqual(len(context.captured_queries), 1)
+
+    def test_group_change_invalidates_cached_roles(self):
+        """Тест: после добавления в группу модераторов доступ меняется сразу"""
+        self.client.force_authenticate(user=self.user)
+        url = f'/api/courses/courses/{self.course.id}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.user.groups.add(self.moderator_group)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.moderator_group.user_set.remove(self.user)
+        self.user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_token_contains_roles_claim(self):
+        """Тест: выданный JWT содержит claim с ролями"""
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        self.user.groups.add(self.moderator_group)
+        response = self.client.post('/api/users/token/', {
+            'email': 'roles@example.com',
+            'password': 'testpass123'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['roles'], ['moderators'])
+
+
+class SparseFieldsetTests(APITestCase):
+    """Тесты параметров ?fields= и ?expand="""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='fields@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Курс',
+            description='Длинное описание курса',
+            owner=self.user
+        )
+        Lesson.objects.create(
+            title='Урок',
+            description='Длинное описание урока',
+            video_url='https://youtube.com/watch?v=abc123',
+            course=self.course,
+            owner=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_lessons_are_opt_in(self):
+        """Тест: уроки выводятся только по ?expand=lessons"""
+        url = f'/api/courses/courses/{self.course.id}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('lessons', response.data)
+        self.assertEqual(response.data['lessons_count'], 1)
+
+        response = self.client.get(url, {'expand': 'lessons'})
+        self.assertEqual(len(response.data['lessons']), 1)
+
+    def test_fields_limit_response_and_loaded_columns(self):
+        """Тест: ?fields= оставляет только запрошенные поля и не грузит лишние колонки"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/courses/courses/', {'fields': 'id,title'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+        course_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "courses_course"' in query['sql'] and 'COUNT(' not in query['sql']
+        ]
+        self.assertEqual(len(course_queries), 1)
+        self.assertNotIn('"description"', course_queries[0])
+        self.assertNotIn('courses_lesson', course_queries[0])
+
+
+class CourseResponseCacheTests(APITestCase):
+    """Тесты кеширования ответов CourseViewSet"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='cache@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Кешируемый курс',
+            description='Описание курса',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Урок',
+            description='Описание урока',
+            video_url='https://youtube.com/watch?v=abc123',
+            course=self.course,
+            owner=self.user
+        )
+        self.url = f'/api/courses/courses/{self.course.id}/'
+        self.client.force_authenticate(user=self.user)
+
+    def test_repeated_retrieve_is_served_from_cache(self):
+        """Тест: повторный запрос деталей курса не обращается к БД"""
+        first = self.client.get(self.url, {'expand': 'lessons'})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(self.url, {'expand': 'lessons'})
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(first.data, second.data)
+
+    def test_lesson_and_subscription_changes_invalidate_cache(self):
+        """Тест: изменение урока и подписки сбрасывают кеш курса"""
+        self.client.get(self.url, {'expand': 'lessons'})
+
+        response = self.client.patch(f'/api/courses/lessons/{self.lesson.id}/', {'title': 'Новый урок'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, {'expand': 'lessons'})
+        self.assertEqual(response.data['lessons'][0]['title'], 'Новый урок')
+        self.assertFalse(response.data['is_subscribed'])
+
+        self.client.post(f'{self.url}subscribe/')
+        response = self.client.get(self.url, {'expand': 'lessons'})
+        self.assertTrue(response.data['is_subscribed'])
+
+
+class ConditionalGetTests(APITestCase):
+    """Тесты ETag / Last-Modified и ответа 304"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='etag@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Курс',
+            description='Описание курса',
+            owner=self.user
+        )
+        self.lesson = Lesson.objects.create(
+            title='Урок',
+            description='Описание урока',
+            video_url='https://youtube.com/watch?v=abc123',
+            course=self.course,
+            owner=self.user
+        )
+        self.url = f'/api/courses/courses/{self.course.id}/'
+        self.client.force_authenticate(user=self.user)
+
+    def test_not_modified_course_is_not_serialized(self):
+        """Тест: при совпадении ETag ответ 304 без обращения к БД"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        with CaptureQueriesContext(connection) as context:
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_lesson_update_changes_course_etag(self):
+        """Тест: обновление урока меняет ETag курса"""
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.patch(f'/api/courses/lessons/{self.lesson.id}/', {'title': 'Новый урок'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_lesson_list_etag(self):
+        """Тест: список уроков отдает 304, пока уроки не менялись"""
+        url = '/api/courses/lessons/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.lesson.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_invalid_pk_returns_404(self):
+        """Тест: нечисловой id курса или урока дает 404, а не 500"""
+        self.assertEqual(self.client.get('/api/courses/courses/abc/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/courses/lessons/abc/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LessonBulkTests(APITestCase):
+    """Тесты массового создания и обновления уроков"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='bulk@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='bulk-other@example.com',
+            password='testpass123'
+        )
+        self.course = Course.objects.create(
+            title='Курс',
+            description='Описание курса',
+            owner=self.user
+        )
+        self.url = '/api/courses/lessons/bulk/'
+        self.client.force_authenticate(user=self.user)
+
+    def lesson_data(self, number):
+        return {
+            'title': f'Урок {number}',
+            'description': 'Описание урока',
+            'video_url': f'https://youtube.com/watch?v=abc{number}',
+            'course': self.course.id,
+        }
+
+    def test_bulk_create(self):
+        """Тест: уроки создаются пачкой, курс обновляется один раз"""
+        last_updated = self.course.updated_at
+        data = [self.lesson_data(number) for number in range(20)]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(Lesson.objects.filter(course=self.course, owner=self.user).count(), 20)
+        self.assertLess(len(context.captured_queries), 15)
+
+        self.course.refresh_from_db()
+        self.assertGreater(self.course.updated_at, last_updated)
+
+    def test_bulk_create_validates_every_lesson(self):
+        """Тест: ошибка в одном уроке отменяет весь запрос"""
+        data = [self.lesson_data(1), {**self.lesson_data(2), 'video_url': 'https://vimeo.com/123'}]
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Lesson.objects.count(), 0)
+
+    def test_bulk_update_queues_one_notification(self):
+        """Тест: массовое обновление ставит одно уведомление на курс"""
+        lessons = [
+            Lesson.objects.create(owner=self.user, **{**self.lesson_data(number), 'course': self.course})
+            for number in range(3)
+        ]
+        data = [{'id': lesson.id, 'title': f'Новый урок {lesson.id}'} for lesson in lessons]
+
+        response = self.client.patch(self.url, data, format='json')
+        NotificationOutbox.objects.update(created_at=timezone.now() - timedelta(days=1))
+        with mock.patch('courses.tasks.send_pending_course_update.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                relay_notification_outbox()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        delay.assert_called_once()
+        self.assertEqual(
+            set(Lesson.objects.values_list('title', flat=True)),
+            {f'Новый урок {lesson.id}' for lesson in lessons}
+        )
+
+    def test_bulk_update_foreign_lesson(self):
+        """Тест: чужие уроки нельзя обновить массово"""
+        lesson = Lesson.objects.create(owner=self.other, **{**self.lesson_data(1), 'course': self.course})
+
+        response = self.client.patch(self.url, [{'id': lesson.id, 'title': 'Чужой'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.title, 'Урок 1')
+
+    def test_bulk_move_invalidates_previous_course(self):
+        """Тест: перенос урока в другой курс сбрасывает кеш и ETag прежнего курса"""
+        cache.clear()
+        lesson = Lesson.objects.create(owner=self.user, **{**self.lesson_data(1), 'course': self.course})
+        target = Course.objects.create(title='Другой курс', description='Описание курса', owner=self.user)
+        url = f'/api/courses/courses/{self.course.id}/'
+        cached = self.client.get(url)
+        self.assertEqual(cached.data['lessons_count'], 1)
+
+        response = self.client.patch(self.url, [{'id': lesson.id, 'course': target.id}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=cached['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lessons_count'], 0)
+
+
+class DeltaSyncTests(APITestCase):
+    """Тесты инкрементальной синхронизации (updated_since и удаленные объекты)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='sync@example.com',
+            password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            email='sync-other@example.com',
+            password='testpass123'
+        )
+        self.old_course = Course.objects.create(title='Старый курс', description='Описание', owner=self.user)
+        self.new_course = Course.objects.create(title='Новый курс', description='Описание', owner=self.user)
+        Course.objects.filter(pk=self.old_course.pk).update(updated_at=timezone.now() - timedelta(days=2))
+        self.client.force_authenticate(user=self.user)
+
+    def test_updated_since(self):
+        """Тест: список курсов фильтруется по времени изменения"""
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+
+        response = self.client.get('/api/courses/courses/', {'updated_since': since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([course['id'] for course in response.data['results']], [self.new_course.id])
+
+    def test_invalid_updated_since(self):
+        """Тест: некорректная дата - ошибка 400"""
+        response = self.client.get('/api/courses/courses/', {'updated_since': 'вчера'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_deleted_feed(self):
+        """Тест: удаленные курсы и их уроки попадают в ленту удалений владельца"""
+        since = timezone.now().isoformat()
+        lesson = Lesson.objects.create(
+            title='Урок',
+            description='Описание урока',
+            video_url='https://youtube.com/watch?v=abc123',
+            course=self.new_course,
+            owner=self.user
+        )
+        foreign = Course.objects.create(title='Чужой курс', description='Описание', owner=self.other)
+        course_id = self.new_course.id
+        self.new_course.delete()
+        foreign.delete()
+
+        response = self.client.get('/api/courses/courses/deleted/', {'updated_since': since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [course_id])
+
+        response = self.client.get('/api/courses/lessons/deleted/', {'course': course_id})
+        self.assertEqual([item['id'] for item in response.data['results']], [lesson.id])
+
+    @override_settings(TOMBSTONE_RETENTION_DAYS=30)
+    def test_old_tombstones_are_pruned(self):
+        """Тест: старые отметки удаляются, клиенту с давним updated_since нужна полная синхронизация"""
+        from courses.models import Tombstone
+        from courses.tasks import prune_tombstones
+
+        old_id, new_id = self.old_course.id, self.new_course.id
+        self.old_course.delete()
+        self.new_course.delete()
+        Tombstone.objects.filter(object_id=old_id).update(deleted_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [new_id])
+
+        since = (timezone.now() - timedelta(days=31)).isoformat()
+        response = self.client.get('/api/courses/courses/deleted/', {'updated_since': since})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertTrue(response.data['full_resync'])
+
+
+class CourseUpdateEmailTests(TestCase):
+    """Тесты рассылки об обновлении курса"""
+
+    def setUp(self):
+        owner = User.objects.create_user(email='mail-owner@example.com', password='testpass123')
+        self.course = Course.objects.create(title='Курс', description='Описание курса', owner=owner)
+        for number in range(5):
+            user = User.objects.create_user(email=f'subscriber{number}@example.com', password='testpass123')
+            Subscription.objects.create(user=user, course=self.course, is_active=True)
+        inactive = User.objects.create_user(email='inactive@example.com', password='testpass123')
+        Subscription.objects.create(user=inactive, course=self.course, is_active=False)
+
+    def test_small_fan_out_is_sent_inline(self):
+        """Тест: небольшая рассылка уходит сразу, одним соединением"""
+        with mock.patch('courses.tasks.get_connection', wraps=get_connection) as connection:
+            result = send_course_update_email(self.course.id, 'Добавлен урок')
+
+        self.assertEqual(result, {'course_id': self.course.id, 'sent': 5, 'failed': 0})
+        self.assertEqual(connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertNotIn('inactive@example.com', [message.to[0] for message in mail.outbox])
+
+    def test_subscriber_id_ranges(self):
+        """Тест: диапазоны id покрывают всех активных подписчиков по chunk_size"""
+        ids = list(Subscription.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+
+        self.assertEqual(subscriber_id_ranges(self.course.id, 2), [(ids[0], ids[2]), (ids[2], ids[4]), (ids[4], None)])
+
+    @override_settings(COURSE_UPDATE_EMAIL_CHUNK_SIZE=2)
+    def test_large_fan_out_is_split_into_chunks(self):
+        """Тест: большая рассылка делится на задачи по диапазонам подписчиков"""
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+        with mock.patch('courses.tasks.get_connection', wraps=get_connection) as connection:
+            with mock.patch('courses.tasks.logger') as logger:
+                result = send_course_update_email(self.course.id, 'Добавлен урок')
+
+        self.assertEqual(result, {'course_id': self.course.id, 'chunks': 3})
+        self.assertEqual(connection.call_count, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertIn('доставлено 5', logger.info.call_args[0][0])
+
+    def test_repeated_notification_is_not_resent(self):
+        """Тест: повтор рассылки с тем же ключом не отправляет письма второй раз"""
+        send_course_update_email(self.course.id, 'Добавлен урок', 'course-update:1')
+        result = send_course_update_email(self.course.id, 'Добавлен урок', 'course-update:1')
+
+        self.assertEqual(result, {'course_id': self.course.id, 'sent': 0, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_recipient_is_resent(self):
+        """Тест: недоставленное письмо теряет отметку и уходит при повторе"""
+        first_fails = lambda messages: [False] + [True] * (len(messages) - 1)  # noqa: E731
+        with mock.patch('courses.tasks.send_messages_each', side_effect=first_fails):
+            result = send_course_update_email(self.course.id, 'Добавлен урок', 'course-update:1')
+        self.assertEqual((result['sent'], result['failed']), (4, 1))
+        self.assertEqual(NotificationDelivery.objects.count(), 4)
+
+        result = send_course_update_email(self.course.id, 'Добавлен урок', 'course-update:1')
+        self.assertEqual((result['sent'], result['failed']), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_missing_course(self):
+        """Тест: для несуществующего курса ничего не отправляется"""
+        result = send_course_update_email(0, 'Добавлен урок')
+        self.assertEqual((result['sent'], result['failed']), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@override_settings(COURSE_UPDATE_NOTIFY_WINDOW=600, NOTIFICATION_RELAY_TIMEOUT=3600)
+class CourseUpdateNotifyWindowTests(APITestCase):
+    """Тесты объединения правок курса в одно уведомление"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='window@example.com', password='testpass123')
+        self.course = Course.objects.create(title='Курс', description='Описание курса', owner=self.user)
+        self.lessons = [
+            Lesson.objects.create(
+                title=f'Урок {number}',
+                description='Описание урока',
+                video_url=f'https://youtube.com/watch?v=abc{number}',
+                course=self.course,
+                owner=self.user
+            )
+            for number in range(2)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def update_lessons(self):
+        for lesson in self.lessons:
+            response = self.client.patch(f'/api/courses/lessons/{lesson.id}/', {'title': f'Новый {lesson.title}'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def relay(self, seconds_passed=601):
+        """Запуск ретранслятора через seconds_passed секунд после правок; возвращает поставленные задачи"""
+        NotificationOutbox.objects.update(created_at=F('created_at') - timedelta(seconds=seconds_passed))
+        with mock.patch('courses.tasks.send_pending_course_update.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                relay_notification_outbox()
+        return [call.args for call in delay.call_args_list]
+
+    def test_edits_in_window_are_merged(self):
+        """Тест: правки за окно дают одно уведомление со списком уроков"""
+        self.update_lessons()
+        self.assertEqual(self.relay(seconds_passed=300), [])
+
+        scheduled = self.relay(seconds_passed=301)
+        last_id = NotificationOutbox.objects.latest('id').id
+        self.assertEqual(scheduled, [(self.course.id, last_id)])
+
+        with mock.patch('courses.tasks.send_course_update_email', return_value={'sent': 1, 'failed': 0}) as send:
+            result = send_pending_course_update(self.course.id, last_id)
+        message = send.call_args[0][1]
+        self.assertIn('Новый Урок 0', message)
+        self.assertIn('Новый Урок 1', message)
+        self.assertEqual(send.call_args[0][2], f'course-update:{self.course.id}:{last_id}')
+        self.assertEqual(result['lessons'], [lesson.id for lesson in self.lessons])
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_edit_after_relay_opens_next_window(self):
+        """Тест: правка после передачи в рассылку ждет своего окна, а не уходит повторно"""
+        self.update_lessons()
+        [(course_id, last_id)] = self.relay()
+        self.update_lessons()
+        self.assertEqual(self.relay(seconds_passed=0), [])
+
+        with mock.patch('courses.tasks.send_course_update_email', return_value={'sent': 1, 'failed': 0}):
+            send_pending_course_update(course_id, last_id)
+        self.assertEqual(NotificationOutbox.objects.filter(relayed_at__isnull=True).count(), 2)
+        self.assertEqual(len(self.relay()), 1)
+
+    def test_redelivered_task_sends_nothing(self):
+        """Тест: повторно доставленная копия задачи не отправляет уведомление второй раз"""
+        self.update_lessons()
+        [(course_id, last_id)] = self.relay()
+        with mock.patch('courses.tasks.send_course_update_email', return_value={'sent': 1, 'failed': 0}):
+            send_pending_course_update(course_id, last_id)
+        self.update_lessons()
+
+        with mock.patch('courses.tasks.send_course_update_email') as send:
+            result = send_pending_course_update(course_id, last_id)
+        send.assert_not_called()
+        self.assertEqual(result['lessons'], [])
+        self.assertEqual(NotificationOutbox.objects.count(), 2)
+
+    def test_failed_send_keeps_changes(self):
+        """Тест: неотправленные правки остаются в outbox и передаются заново после NOTIFICATION_RELAY_TIMEOUT"""
+        self.update_lessons()
+        [(course_id, last_id)] = self.relay()
+        with mock.patch('courses.tasks.send_course_update_email', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                send_pending_course_update(course_id, last_id)
+        self.assertEqual(NotificationOutbox.objects.filter(course=self.course).count(), 2)
+
+        self.assertEqual(self.relay(), [])
+        NotificationOutbox.objects.update(relayed_at=F('relayed_at') - timedelta(seconds=3601))
+        self.assertEqual(self.relay(), [(course_id, last_id)])
+
+    def test_relay_schedules_after_commit(self):
+        """Тест: задача уведомления ставится только после коммита ретранслятора"""
+        self.update_lessons()
+        NotificationOutbox.objects.update(created_at=F('created_at') - timedelta(seconds=601))
+        with mock.patch('courses.tasks.send_pending_course_update.delay') as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                relay_notification_outbox()
+            delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+        delay.assert_called_once()
+
+
+class CourseUpdateDigestTests(TestCase):
+    """Тесты режима сводки для подписчиков"""
+
+    def setUp(self):
+        owner = User.objects.create_user(email='digest-owner@example.com', password='testpass123')
+        self.courses = [
+            Course.objects.create(title=f'Курс {number}', description='Описание курса', owner=owner)
+            for number in range(3)
+        ]
+        self.reader = User.objects.create_user(email='reader@example.com', password='testpass123')
+        self.heavy = User.objects.create_user(email='heavy@example.com', password='testpass123')
+        for course in self.courses:
+            Subscription.objects.create(user=self.reader, course=course, is_active=True)
+            Subscription.objects.create(user=self.heavy, course=course, is_active=True, digest=True)
+
+    def test_digest_subscribers_get_one_email(self):
+        """Тест: подписчик в режиме сводки получает одно письмо за период"""
+        for course in self.courses * 2:
+            send_course_update_email(course.id, 'Добавлен урок')
+        self.assertEqual([message.to for message in mail.outbox], [['reader@example.com']] * 6)
+        self.assertEqual(DigestEntry.objects.filter(user=self.heavy).count(), 3)
+
+        mail.outbox.clear()
+        result = send_course_update_digests()
+
+        self.assertEqual(result, {'sent': 1, 'failed': 0})
+        self.assertEqual(mail.outbox[0].to, ['heavy@example.com'])
+        for course in self.courses:
+            self.assertIn(course.title, mail.outbox[0].body)
+        self.assertFalse(DigestEntry.objects.exists())
+
+
+class StripePriceRegistryTests(TestCase):
+    """Тесты повторного использования продукта и цены Stripe"""
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user(email='stripe-owner@example.com', password='testpass123')
+        self.course = Course.objects.create(title='Курс', description='Описание курса', owner=owner, price=1000)
+
+    def test_price_is_created_once_per_version(self):
+        """Тест: продукт создается один раз, цена - при каждой смене цены"""
+        from courses.services.stripe_registry import get_stripe_price_id
+
+        with mock.patch('courses.services.stripe_registry.StripeService') as service:
+            service.create_product.return_value = mock.Mock(id='prod_1')
+            service.create_price.side_effect = [mock.Mock(id='price_1'), mock.Mock(id='price_2')]
+
+            self.assertEqual(get_stripe_price_id(self.course), 'price_1')
+            self.assertEqual(get_stripe_price_id(Course.objects.get(pk=self.course.pk)), 'price_1')
+
+            Course.objects.filter(pk=self.course.pk).update(price=1200)
+            self.assertEqual(get_stripe_price_id(Course.objects.get(pk=self.course.pk)), 'price_2')
+
+        self.assertEqual(service.create_product.call_count, 1)
+        self.assertEqual(service.create_price.call_count, 2)
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.stripe_product_id, self.course.stripe_price_id), ('prod_1', 'price_2'))
+
+    def test_new_price_invalidates_course_cache(self):
+        """Тест: сохранение Stripe ID сбрасывает кеш курса (update() не вызывает сигналы)"""
+        from courses.services.stripe_registry import get_stripe_price_id
+
+        with mock.patch('courses.services.stripe_registry.StripeService') as service, \
+                mock.patch('courses.services.stripe_registry.invalidate_course') as invalidate:
+            service.create_product.return_value = mock.Mock(id='prod_1')
+            service.create_price.return_value = mock.Mock(id='price_1')
+            get_stripe_price_id(self.course)
+
+        invalidate.assert_called_once_with(self.course.pk)
+
+    @override_settings(STRIPE_IDEMPOTENCY_PREFIX='staging')
+    def test_product_is_kept_when_price_changes_meanwhile(self):
+        """Тест: продукт сохраняется, даже если цену изменили во время создания цены в Stripe"""
+        from courses.services.stripe_registry import get_stripe_price_id
+
+        def change_price(**kwargs):
+            Course.objects.filter(pk=self.course.pk).update(price=1200)
+            return mock.Mock(id='price_1')
+
+        with mock.patch('courses.services.stripe_registry.StripeService') as service:
+            service.create_product.return_value = mock.Mock(id='prod_1')
+            service.create_price.side_effect = change_price
+            get_stripe_price_id(self.course)
+
+        self.assertEqual(
+            service.create_product.call_args.kwargs['idempotency_key'], f'staging-product-course-{self.course.pk}'
+        )
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.stripe_product_id, self.course.stripe_price_id), ('prod_1', None))
+
+
+@override_settings(STRIPE_BREAKER_THRESHOLD=2)
+class StripeCircuitBreakerTests(TestCase):
+    """Тесты предохранителя вызовов Stripe"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_breaker_opens_after_failures(self):
+        """Тест: после серии сбоев Stripe не вызывается до истечения паузы"""
+        import stripe
+        from courses.services.stripe_client import BREAKER_OPEN_KEY, StripeUnavailable, call_stripe
+
+        method = mock.Mock(side_effect=stripe.error.APIConnectionError('timeout'))
+        for _ in range(2):
+            with self.assertRaises(stripe.error.APIConnectionError):
+                call_stripe(method)
+        with self.assertRaises(StripeUnavailable):
+            call_stripe(method)
+        self.assertEqual(method.call_count, 2)
+
+        # Пауза истекла: пробный вызов проходит и сбрасывает счетчик сбоев
+        cache.delete(BREAKER_OPEN_KEY)
+        method.side_effect = None
+        method.return_value = 'ok'
+        self.assertEqual(call_stripe(method), 'ok')
+        method.side_effect = stripe.error.APIConnectionError('timeout')
+        with self.assertRaises(stripe.error.APIConnectionError):
+            call_stripe(method)
+        self.assertIsNone(cache.get(BREAKER_OPEN_KEY))
+
+    def test_single_probe_after_pause(self):
+        """Тест: после паузы к Stripe идет один пробный вызов, остальные получают отказ до его завершения"""
+        import stripe
+        from courses.services.stripe_client import BREAKER_OPEN_KEY, StripeUnavailable, call_stripe
+
+        failing = mock.Mock(side_effect=stripe.error.APIConnectionError('timeout'))
+        for _ in range(2):
+            with self.assertRaises(stripe.error.APIConnectionError):
+                call_stripe(failing)
+        cache.delete(BREAKER_OPEN_KEY)
+
+        concurrent = mock.Mock(return_value='ok')
+
+        def probe():
+            with self.assertRaises(StripeUnavailable):
+                call_stripe(concurrent)
+            raise stripe.error.APIConnectionError('timeout')
+
+        with self.assertRaises(stripe.error.APIConnectionError):
+            call_stripe(probe)
+        concurrent.assert_not_called()
+        # Неудачная проба снова размыкает предохранитель
+        self.assertTrue(cache.get(BREAKER_OPEN_KEY))
+
+    def test_success_does_not_reset_failures_before_pause(self):
+        """Тест: отдельный успешный вызов не обнуляет счетчик, пока другие вызовы продолжают падать"""
+        import stripe
+        from courses.services.stripe_client import BREAKER_OPEN_KEY, call_stripe
+
+        failing = mock.Mock(side_effect=stripe.error.APIConnectionError('timeout'))
+        with self.assertRaises(stripe.error.APIConnectionError):
+            call_stripe(failing)
+        self.assertEqual(call_stripe(mock.Mock(return_value='ok')), 'ok')
+        with self.assertRaises(stripe.error.APIConnectionError):
+            call_stripe(failing)
+        self.assertTrue(cache.get(BREAKER_OPEN_KEY))
+
+    def test_request_errors_do_not_open_breaker(self):
+        """Тест: ошибки запроса (4xx) не считаются сбоями Stripe"""
+        import stripe
+        from courses.services.stripe_client import call_stripe
+
+        method = mock.Mock(side_effect=stripe.error.InvalidRequestError('bad', 'price'))
+        for _ in range(3):
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                call_stripe(method)
+        self.assertEqual(method.call_count, 3)
+
+    def test_every_session_page_goes_through_breaker(self):
+        """Тест: следующая страница списка сессий не запрашивается при разомкнутом предохранителе"""
+        from datetime import datetime
+        from courses.services.stripe_client import BREAKER_OPEN_KEY, StripeUnavailable
+        from courses.services.stripe_service import StripeService
+
+        client = mock.Mock()
+        client.v1.checkout.sessions.list.side_effect = [
+            mock.Mock(data=[mock.Mock(id='cs_1'), mock.Mock(id='cs_2')], has_more=True),
+            mock.Mock(data=[mock.Mock(id='cs_3')], has_more=False),
+        ]
+        with mock.patch('courses.services.stripe_service.get_stripe_client', return_value=client):
+            sessions = StripeService.list_sessions(datetime(2024, 1, 1), page_size=2)
+            self.assertEqual([next(sessions).id, next(sessions).id], ['cs_1', 'cs_2'])
+            cache.set(BREAKER_OPEN_KEY, 1)
+            with self.assertRaises(StripeUnavailable):
+                next(sessions)
+
+        self.assertEqual(client.v1.checkout.sessions.list.call_count, 1)
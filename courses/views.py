@@ -1,27 +1,46 @@
+﻿from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, Exists, OuterRef
 from rest_framework import viewsets, permissions, filters, status, generics
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.utils import timezone
-from datetime import timedelta
-from .tasks import send_course_update_email
+from .notifications import queue_course_update
 from .models import Course, Lesson, Subscription
-from users.models import Payment
-from .serializers import CourseSerializer, LessonSerializer, SubscriptionSerializer
+from users.entitlements import has_entitlement
+from users.roles import is_moderator
+from .serializers import CourseSerializer, LessonSerializer, LessonBulkSerializer, SubscriptionSerializer
 from .permissions import IsModerator, IsOwner
-from .paginators import CoursePagination, LessonPagination, SubscriptionPagination
+from .cache import (
+    STATE_KEY, CachedCourseResponseMixin, build_response_cache_key, course_version_keys, get_versions,
+    invalidate_course,
+)
+from .conditional import ConditionalGetMixin
+from .sync import TombstoneFeedMixin
+from .filters import CourseFilter, FullTextSearchFilter, LessonFilter
+from .paginators import (
+    CoursePagination, LessonPagination, SubscriptionPagination,
+    CourseCursorPagination, LessonCursorPagination, SubscriptionCursorPagination,
+    SelectablePaginationMixin,
+)
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(TombstoneFeedMixin, ConditionalGetMixin, CachedCourseResponseMixin, SelectablePaginationMixin,
+                    viewsets.ModelViewSet):
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = CourseFilter
     search_fields = ['title', 'description']
-    ordering_fields = ['created_at', 'title']
+    ordering_fields = ['created_at', 'updated_at', 'title']
+    tombstone_model_name = 'course'
     pagination_class = CoursePagination
+    cursor_pagination_class = CourseCursorPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -34,14 +53,54 @@ class CourseViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
-    def get_queryset(self):
+    def get_conditional_queryset(self):
+        """Курсы, видимые пользователю, без аннотаций и prefetch"""
         user = self.request.user
         if not user.is_authenticated:
             return Course.objects.none()
-        if user.is_superuser or user.groups.filter(name='moderators').exists():
+        if user.is_superuser or is_moderator(self.request):
             return Course.objects.all()
         return Course.objects.filter(owner=user)
 
+    def get_conditional_state(self, request, pk=None):
+        # Состояние для ETag кешируется под теми же версиями, что и ответ,
+        # поэтому повторный опрос без изменений не обращается к БД
+        key = build_response_cache_key(request, course_version_keys(request.user.pk, pk), STATE_KEY)
+        state = cache.get(key)
+        if state is None:
+            state = super().get_conditional_state(request, pk)
+            if state is not None:
+                cache.set(key, state, settings.COURSE_CACHE_TIMEOUT)
+        return state
+
+    def get_etag_extra(self, request, pk=None):
+        # is_subscribed и lessons_count не меняют updated_at курса,
+        # поэтому в ETag входят версии кеша курса и подписок пользователя
+        return get_versions(course_version_keys(request.user.pk, pk))
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = self.get_conditional_queryset()
+
+        # Количество уроков и подписку считаем в одном запросе, а уроки
+        # подгружаем пачкой, чтобы страница не порождала N+1 запросов.
+        # Загружаем только те колонки и связи, которые попадут в ответ.
+        serializer_class = self.get_serializer_class()
+        annotations = {}
+        if serializer_class.is_field_rendered(self.request, 'lessons_count'):
+            annotations['lessons_count'] = Count('lessons', distinct=True)
+        if serializer_class.is_field_rendered(self.request, 'is_subscribed'):
+            annotations['is_subscribed'] = Exists(
+                Subscription.objects.filter(user=user, course=OuterRef('pk'), is_active=True)
+            )
+        queryset = queryset.annotate(**annotations)
+        if serializer_class.is_field_rendered(self.request, 'lessons'):
+            queryset = queryset.prefetch_related('lessons')
+        only_fields = serializer_class.get_only_fields(self.request)
+        if only_fields:
+            queryset = queryset.only(*only_fields)
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
@@ -95,13 +154,7 @@ class CourseViewSet(viewsets.ModelViewSet):
     def buy(self, request, pk=None):
         from django.urls import reverse
         course = self.get_object()
-        from users.models import Payment
-        existing_payment = Payment.objects.filter(
-            user=request.user,
-            paid_course=course,
-            status='paid'
-        ).exists()
-        if existing_payment:
+        if has_entitlement(request.user, course=course):
             return Response(
                 {'error': 'Вы уже приобрели этот курс'},
                 status=status.HTTP_409_CONFLICT
@@ -122,17 +175,28 @@ class CourseViewSet(viewsets.ModelViewSet):
         }, status=status.HTTP_200_OK)
 
 
-class LessonViewSet(viewsets.ModelViewSet):
+def touch_previous_course(previous_course_id, lesson):
+    """Урок перенесен в другой курс: у прежнего тоже изменились lessons_count и ETag"""
+    if previous_course_id and previous_course_id != lesson.course_id:
+        Course.objects.filter(pk=previous_course_id).update(updated_at=timezone.now())
+        invalidate_course(previous_course_id)
+
+
+class LessonViewSet(TombstoneFeedMixin, ConditionalGetMixin, SelectablePaginationMixin, viewsets.ModelViewSet):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['course']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = LessonFilter
     search_fields = ['title', 'description']
-    ordering_fields = ['created_at', 'title']
+    ordering_fields = ['created_at', 'updated_at', 'title']
+    tombstone_model_name = 'lesson'
     pagination_class = LessonPagination
+    cursor_pagination_class = LessonCursorPagination
+    # Максимум уроков в одном запросе к /bulk/
+    bulk_max_size = 500
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action == 'create' or (self.action == 'bulk' and self.request.method == 'POST'):
             permission_classes = [permissions.IsAuthenticated & ~IsModerator]
         elif self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [permissions.IsAuthenticated]
@@ -144,11 +208,14 @@ class LessonViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if not user.is_authenticated:
             return Lesson.objects.none()
-        if user.is_superuser:
-            return Lesson.objects.all()
-        if user.groups.filter(name='moderators').exists():
-            return Lesson.objects.all()
-        return Lesson.objects.filter(owner=user)
+        if user.is_superuser or is_moderator(self.request):
+            queryset = Lesson.objects.all()
+        else:
+            queryset = Lesson.objects.filter(owner=user)
+        only_fields = self.get_serializer_class().get_only_fields(self.request)
+        if only_fields:
+            queryset = queryset.only(*only_fields)
+        return queryset
 
     def perform_create(self, serializer):
         lesson = serializer.save(owner=self.request.user)
@@ -157,49 +224,89 @@ class LessonViewSet(viewsets.ModelViewSet):
             lesson.course.save()
         return lesson
 
+    def perform_destroy(self, instance):
+        # Удаление урока тоже меняет курс (Last-Modified, lessons_count)
+        course = instance.course
+        instance.delete()
+        course.updated_at = timezone.now()
+        course.save()
+
     def perform_update(self, serializer):
         """
-        При обновлении урока:
-        1. Проверяем, прошло ли более 4 часов с последнего обновления курса
-        2. Если да - отправляем асинхронные уведомления подписчикам
-        3. Обновляем время курса
+        При обновлении урока обновляем время курса и в той же транзакции
+        пишем правку в outbox уведомлений: все правки курса за окно уходят
+        подписчикам одним письмом со списком измененных уроков
         """
-        from .tasks import send_course_update_email
-
-        lesson = self.get_object()
-        course = lesson.course
-
-        if not course:
-            return serializer.save()
-
-        # Сохраняем старое время курса
-        last_updated = course.updated_at
-
-        # Сохраняем обновленный урок
-        updated_lesson = serializer.save()
+        previous_course_id = serializer.instance.course_id
+        with transaction.atomic():
+            updated_lesson = serializer.save()
+            touch_previous_course(previous_course_id, updated_lesson)
+            course = updated_lesson.course
+            if course:
+                course.updated_at = timezone.now()
+                course.save()
+                queue_course_update(course.id, [updated_lesson])
+        return updated_lesson
 
-        # Проверяем условие ДО обновления времени курса
-        now = timezone.now()
-        time_difference = now - last_updated if last_updated else timedelta(hours=5)
+    def get_serializer_class(self):
+        if self.action == 'bulk':
+            return LessonBulkSerializer
+        return super().get_serializer_class()
 
-        # Проверка 4-х часов (дополнительное задание)
-        if time_difference > timedelta(hours=4):
-            update_message = f"Урок '{lesson.title}' был обновлен."
-            # Асинхронная отправка уведомлений подписчикам
-            send_course_update_email.delay(course.id, update_message)
+    def touch_courses(self, lessons, notify, previous_course_ids=()):
+        """
+        Обновляет updated_at затронутых курсов одним UPDATE и пишет
+        измененные уроки в outbox уведомлений своих курсов.
+        previous_course_ids - курсы, из которых уроки могли быть перенесены.
+        """
+        course_ids = {lesson.course_id for lesson in lessons}
+        touched_ids = (course_ids | set(previous_course_ids)) - {None}
+        Course.objects.filter(pk__in=touched_ids).update(updated_at=timezone.now())
+        for course_id in touched_ids:
+            if notify and course_id in course_ids:
+                queue_course_update(course_id, [lesson for lesson in lessons if lesson.course_id == course_id])
+            # bulk_create/bulk_update и update() не вызывают сигналы
+            invalidate_course(course_id)
 
-        # Обновляем время курса ПОСЛЕ проверки
-        course.updated_at = now
-        course.save()
+    @extend_schema(
+        summary="Массовое создание или обновление уроков",
+        description="""POST - создает список уроков, PATCH - частично обновляет уроки
+        по переданным id. Все уроки записываются в одной транзакции, курс
+        обновляется один раз, измененные уроки попадают в одно уведомление на курс.""",
+        request=LessonBulkSerializer(many=True),
+        responses={200: LessonSerializer(many=True), 201: LessonSerializer(many=True)},
+    )
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=request.data, many=True, max_length=self.bulk_max_size)
+            response_status = status.HTTP_201_CREATED
+        else:
+            items = request.data if isinstance(request.data, list) else []
+            ids = [str(item.get('id')) for item in items if isinstance(item, dict)]
+            lessons = self.get_queryset().filter(pk__in=[pk for pk in ids if pk.isdigit()])
+            serializer = self.get_serializer(
+                lessons, data=request.data, many=True, partial=True, max_length=self.bulk_max_size
+            )
+            response_status = status.HTTP_200_OK
+        serializer.is_valid(raise_exception=True)
 
-        return updated_lesson
+        previous_course_ids = set()
+        if request.method == 'PATCH':
+            # Курсы до сохранения: при переносе урока меняется и прежний курс
+            previous_course_ids = set(serializer.instance.values_list('course_id', flat=True))
+        with transaction.atomic():
+            lessons = serializer.save()
+            self.touch_courses(lessons, notify=request.method == 'PATCH', previous_course_ids=previous_course_ids)
+        return Response(serializer.data, status=response_status)
 
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+class SubscriptionViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
     queryset = Subscription.objects.all()
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = SubscriptionPagination
+    cursor_pagination_class = SubscriptionCursorPagination
 
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
@@ -219,14 +326,9 @@ class CourseUpdateAPIView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAdminUser]
 
     def perform_update(self, serializer):
-        course = self.get_object()
-        last_updated = course.updated_at
-        updated_course = serializer.save()
-        now = timezone.now()
-        time_difference = now - last_updated if last_updated else timedelta(hours=5)
-        if time_difference > timedelta(hours=4):
-            update_message = "Материалы курса были обновлены."
-            send_course_update_email.delay(course.id, update_message)
+        with transaction.atomic():
+            updated_course = serializer.save()
+            queue_course_update(updated_course.id)
         return updated_course
 
 
@@ -236,15 +338,12 @@ class LessonUpdateAPIView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAdminUser]
 
     def perform_update(self, serializer):
-        lesson = self.get_object()
-        course = lesson.course
-        last_updated = course.updated_at
-        updated_lesson = serializer.save()
-        course.updated_at = timezone.now()
-        course.save()
-        now = timezone.now()
-        time_difference = now - last_updated if last_updated else timedelta(hours=5)
-        if time_difference > timedelta(hours=4):
-            update_message = f"Урок '{lesson.title}' был обновлен."
-            send_course_update_email.delay(course.id, update_message)
-        return updated_lesson
\ No newline at end of file
+        previous_course_id = serializer.instance.course_id
+        with transaction.atomic():
+            updated_lesson = serializer.save()
+            touch_previous_course(previous_course_id, updated_lesson)
+            course = updated_lesson.course
+            course.updated_at = timezone.now()
+            course.save()
+            queue_course_update(course.id, [updated_lesson])
+        return updated_lesson
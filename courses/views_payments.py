@@ -9,7 +9,11 @@ from drf_spectacular.utils import extend_schema, OpenApiParameter
 from .models import Course, Lesson
 from users.models import Payment
 from .serializers import PaymentCreateSerializer, PaymentSerializer
+from .services.stripe_client import StripeUnavailable
+from .services.stripe_registry import get_stripe_price_id
 from .services.stripe_service import StripeService
+from .services.stripe_sessions import get_checkout_session
+from users.entitlements import has_entitlement
 
 try:
     from users.models import Payment
@@ -55,54 +59,36 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
 
         # Получаем курс или урок
         if course_id:
-            course = get_object_or_404(Course, id=course_id)
-            product_name = course.title
-            product_description = course.description
-            amount = course.price if hasattr(course, 'price') else 1500.00
-            metadata = {'course_id': course.id, 'type': 'course'}
+            item = get_object_or_404(Course, id=course_id)
+            item_type = 'course'
         else:
-            lesson = get_object_or_404(Lesson, id=lesson_id)
-            product_name = lesson.title
-            product_description = lesson.description
-            amount = 500.00  # Фиксированная цена урока
-            metadata = {'lesson_id': lesson.id, 'type': 'lesson'}
+            item = get_object_or_404(Lesson, id=lesson_id)
+            item_type = 'lesson'
+        amount = item.price
+
+        # Stripe не создает сессию оплаты на нулевую сумму
+        if amount <= 0:
+            return Response(
+                {'error': 'Этот курс/урок бесплатный, оплата не требуется'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # Проверяем, не оплачено ли уже
-        existing_payment = Payment.objects.filter(
-            user=user,
-            paid_course_id=course_id if course_id else None,
-            paid_lesson_id=lesson_id if lesson_id else None,
-            status='paid'
-        ).exists()
+        if item_type == 'course':
+            already_paid = has_entitlement(user, course=item)
+        else:
+            already_paid = has_entitlement(user, lesson=item)
 
-        if existing_payment:
+        if already_paid:
             return Response(
                 {'error': 'Этот курс/урок уже оплачен'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         if payment_method == 'stripe':
-            # Создаем продукт в Stripe
-            product = StripeService.create_product(
-                name=product_name,
-                description=product_description,
-                metadata=metadata
-            )
-
-            if not product:
-                return Response(
-                    {'error': 'Ошибка создания продукта в платежной системе'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-
-            # Создаем цену
-            price = StripeService.create_price(product.id, amount)
-
-            if not price:
-                return Response(
-                    {'error': 'Ошибка создания цены в платежной системе'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+            # Продукт и цена создаются в Stripe один раз на версию цены,
+            # дальше берутся из БД/кеша без обращения к Stripe
+            price_id = get_stripe_price_id(item)
 
             # Создаем URL для редиректа
             success_url = request.build_absolute_uri(
@@ -114,14 +100,12 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
 
             # Создаем сессию оплаты
             session = StripeService.create_checkout_session(
-                price_id=price.id,
+                price_id=price_id,
+                user_id=user.id,
+                item_id=item.id,
+                item_type=item_type,
                 success_url=success_url,
-                cancel_url=cancel_url,
-                metadata={
-                    'user_id': user.id,
-                    'user_email': user.email,
-                    **metadata
-                }
+                cancel_url=cancel_url
             )
 
             if not session:
@@ -135,11 +119,11 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
                 user=user,
                 paid_course_id=course_id if course_id else None,
                 paid_lesson_id=lesson_id if lesson_id else None,
-                payment_amount=amount,
+                amount=amount,
                 payment_method='stripe',
                 status='pending',
-                stripe_product_id=product.id,
-                stripe_price_id=price.id,
+                stripe_product_id=item.stripe_product_id,
+                stripe_price_id=price_id,
                 stripe_session_id=session.id
             )
 
@@ -158,7 +142,7 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
                 user=user,
                 paid_course_id=course_id if course_id else None,
                 paid_lesson_id=lesson_id if lesson_id else None,
-                payment_amount=amount,
+                amount=amount,
                 payment_method=payment_method,
                 status='pending'
             )
@@ -196,8 +180,25 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Получаем информацию из Stripe
-        session = StripeService.retrieve_session(session_id)
+        # Завершенный платеж отдаем из БД: его статус поддерживают
+        # вебхук и периодическая сверка (reconcile_stripe_payments)
+        payment = Payment.objects.filter(stripe_session_id=session_id).exclude(status='pending').first()
+        if payment is not None:
+            return Response({
+                'session_id': session_id,
+                'payment_status': 'paid' if payment.status == 'paid' else 'unpaid',
+                'amount_total': payment.amount,
+                'currency': payment.currency.upper(),
+                'payment_intent': payment.stripe_payment_intent_id or None,
+                'local_payment_id': payment.id,
+                'local_payment_status': payment.status
+            })
+
+        # Получаем информацию из Stripe (короткий кеш на время опроса)
+        try:
+            session = get_checkout_session(session_id)
+        except StripeUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         if not session:
             return Response(
@@ -213,9 +214,6 @@ class StripePaymentViewSet(viewsets.GenericViewSet):
                 payment.status = 'paid'
                 payment.save()
 
-                # Здесь можно добавить логику предоставления доступа
-                # к курсу/уроку после успешной оплаты
-
             return Response({
                 'session_id': session.id,
                 'payment_status': session.payment_status,
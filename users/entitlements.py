@@ -0,0 +1,58 @@
+# users/entitlements.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Entitlement
+
+# Набор доступов пользователя: {('course', id), ('lesson', id), ...}
+ENTITLEMENTS_KEY = 'entitlements:{user_id}'
+
+
+def _invalidate(user_ids):
+    keys = [ENTITLEMENTS_KEY.format(user_id=user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # Повторно после коммита: читатель мог закешировать набор до него
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def grant_entitlements(payments):
+    """
+    Выдает доступы по оплаченным платежам из payments (остальные
+    пропускаются) и сбрасывает кеш их пользователей. Повторная выдача
+    ничего не меняет. Вызывается сигналом post_save платежа
+    (users/signals.py) и явно после bulk_update.
+    """
+    rows = [
+        Entitlement(
+            user_id=payment.user_id,
+            course_id=payment.paid_course_id,
+            lesson_id=None if payment.paid_course_id else payment.paid_lesson_id,
+            payment_id=payment.pk,
+        )
+        for payment in payments
+        if payment.status == 'paid' and (payment.paid_course_id or payment.paid_lesson_id)
+    ]
+    if not rows:
+        return 0
+    Entitlement.objects.bulk_create(rows, ignore_conflicts=True)
+    _invalidate({row.user_id for row in rows})
+    return len(rows)
+
+
+def get_entitlements(user_id):
+    """Набор оплаченных пользователем курсов и уроков (из кеша)"""
+    key = ENTITLEMENTS_KEY.format(user_id=user_id)
+    entitlements = cache.get(key)
+    if entitlements is None:
+        entitlements = set()
+        for course_id, lesson_id in Entitlement.objects.filter(user_id=user_id).values_list('course_id', 'lesson_id'):
+            entitlements.add(('course', course_id) if course_id else ('lesson', lesson_id))
+        cache.set(key, entitlements, settings.ENTITLEMENTS_CACHE_TIMEOUT)
+    return entitlements
+
+
+def has_entitlement(user, course=None, lesson=None):
+    """Оплатил ли пользователь курс (course) или урок (lesson)"""
+    item = ('course', course.pk) if course is not None else ('lesson', lesson.pk)
+    return item in get_entitlements(user.pk)
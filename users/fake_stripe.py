@@ -0,0 +1,306 @@
+# users/fake_stripe.py
+"""
+Локальная замена Stripe API для нагрузочного тестирования оплаты.
+
+Поддерживает продукты, цены и сессии Checkout (создание, получение,
+список), ключи идемпотентности и подписанные вебхуки
+checkout.session.completed / checkout.session.expired. Задержка ответа и
+доля ошибок настраиваются. Клиент Stripe направляется на сервер
+настройкой STRIPE_API_BASE, запуск - командой manage.py fake_stripe.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Оплата сессии "в браузере": ссылка из session.url
+PAY_PATH = '/_fake/checkout/'
+# Служебные действия для сценариев: .../pay и .../expire
+SESSION_ACTION_PATH = '/_fake/sessions/'
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Заголовок Stripe-Signature для тела вебхука, как его формирует Stripe"""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def decode_params(pairs):
+    """
+    Разбирает параметры в кодировке Stripe (line_items[0][price]=...,
+    metadata[user_id]=...) во вложенные словари и списки.
+    """
+    result = {}
+    for key, value in pairs:
+        parts = key.replace(']', '').split('[')
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return _lists(result)
+
+
+def _lists(node):
+    if not isinstance(node, dict):
+        return node
+    node = {key: _lists(value) for key, value in node.items()}
+    if node and all(key.isdigit() for key in node):
+        return [node[key] for key in sorted(node, key=int)]
+    return node
+
+
+class FakeStripeError(Exception):
+    def __init__(self, status, error_type, message, param=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': {'type': error_type, 'message': message, 'param': param}}
+
+
+class FakeStripe:
+    """Состояние сервера: объекты Stripe, ответы по ключам идемпотентности"""
+
+    def __init__(self, base_url, webhook_url=None, webhook_secret='', complete_after=None):
+        self.base_url = base_url.rstrip('/')
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.complete_after = complete_after
+        self.products, self.prices, self.sessions = {}, {}, {}
+        self.idempotent = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _id(prefix):
+        return f'{prefix}_{secrets.token_hex(12)}'
+
+    def create_product(self, params):
+        if not params.get('name'):
+            raise FakeStripeError(400, 'invalid_request_error', 'Missing required param: name.', 'name')
+        product = {
+            'id': self._id('prod'), 'object': 'product', 'name': params['name'],
+            'description': params.get('description'), 'metadata': params.get('metadata', {}),
+            'active': True, 'created': int(time.time()), 'livemode': False,
+        }
+        self.products[product['id']] = product
+        return product
+
+    def create_price(self, params):
+        if params.get('product') not in self.products:
+            raise FakeStripeError(400, 'invalid_request_error', 'No such product.', 'product')
+        price = {
+            'id': self._id('price'), 'object': 'price', 'product': params['product'],
+            'unit_amount': int(params.get('unit_amount', 0)), 'currency': params.get('currency', 'usd'),
+            'active': True, 'created': int(time.time()), 'livemode': False,
+        }
+        self.prices[price['id']] = price
+        return price
+
+    def create_session(self, params):
+        amount, currency = 0, None
+        for item in params.get('line_items', []):
+            price = self.prices.get(item.get('price'))
+            if price is None:
+                raise FakeStripeError(400, 'invalid_request_error', 'No such price.', 'line_items')
+            amount += price['unit_amount'] * int(item.get('quantity', 1))
+            currency = price['currency']
+        session_id = self._id('cs_test')
+        session = {
+            'id': session_id, 'object': 'checkout.session', 'mode': params.get('mode', 'payment'),
+            'status': 'open', 'payment_status': 'unpaid', 'payment_intent': None,
+            'amount_total': amount, 'currency': currency, 'metadata': params.get('metadata', {}),
+            'success_url': params.get('success_url'), 'cancel_url': params.get('cancel_url'),
+            'url': f'{self.base_url}{PAY_PATH}{session_id}', 'customer_details': None,
+            'created': int(time.time()), 'livemode': False,
+        }
+        self.sessions[session_id] = session
+        if self.complete_after is not None:
+            timer = threading.Timer(self.complete_after, self.complete_session, (session_id,))
+            timer.daemon = True
+            timer.start()
+        return session
+
+    def get_session(self, session_id):
+        if session_id not in self.sessions:
+            raise FakeStripeError(404, 'invalid_request_error', f'No such checkout.session: {session_id}', 'id')
+        return self.sessions[session_id]
+
+    def list_sessions(self, params):
+        created = params.get('created', {})
+        gte = int(created.get('gte', 0)) if isinstance(created, dict) else 0
+        limit = min(int(params.get('limit', 10)), 100)
+        # Stripe отдает список от новых к старым
+        sessions = [s for s in reversed(list(self.sessions.values())) if s['created'] >= gte]
+        if params.get('starting_after'):
+            ids = [s['id'] for s in sessions]
+            if params['starting_after'] in ids:
+                sessions = sessions[ids.index(params['starting_after']) + 1:]
+        return {
+            'object': 'list', 'url': '/v1/checkout/sessions',
+            'data': sessions[:limit], 'has_more': len(sessions) > limit,
+        }
+
+    def complete_session(self, session_id):
+        with self.lock:
+            session = self.get_session(session_id)
+            if session['status'] != 'open':
+                return session
+            session.update(status='complete', payment_status='paid', payment_intent=self._id('pi'))
+            session['customer_details'] = {'email': 'buyer@example.com'}
+        self.emit('checkout.session.completed', session)
+        return session
+
+    def expire_session(self, session_id):
+        with self.lock:
+            session = self.get_session(session_id)
+            if session['status'] != 'open':
+                return session
+            session['status'] = 'expired'
+        self.emit('checkout.session.expired', session)
+        return session
+
+    def build_event(self, event_type, obj):
+        return {
+            'id': self._id('evt'), 'object': 'event', 'type': event_type, 'api_version': None,
+            'created': int(time.time()), 'livemode': False, 'data': {'object': dict(obj)},
+        }
+
+    def emit(self, event_type, obj):
+        """Отправляет подписанный вебхук; без webhook_url событие только логируется"""
+        event = self.build_event(event_type, obj)
+        if not self.webhook_url:
+            logger.info(f"Fake Stripe: событие {event_type} для {obj['id']} (вебхук не настроен)")
+            return event
+        payload = json.dumps(event)
+        try:
+            requests.post(
+                self.webhook_url, data=payload, timeout=10,
+                headers={
+                    'Content-Type': 'application/json',
+                    'Stripe-Signature': sign_payload(payload, self.webhook_secret),
+                },
+            )
+        except requests.RequestException as e:
+            logger.error(f"Fake Stripe: не удалось доставить {event_type}: {e}")
+        return event
+
+    def handle(self, method, path, params, idempotency_key=None):
+        """Возвращает (статус, тело ответа) для запроса к API"""
+        if method == 'POST' and idempotency_key:
+            with self.lock:
+                if idempotency_key in self.idempotent:
+                    return self.idempotent[idempotency_key]
+        result = self._dispatch(method, path, params)
+        if method == 'POST' and idempotency_key:
+            with self.lock:
+                self.idempotent[idempotency_key] = result
+        return result
+
+    def _dispatch(self, method, path, params):
+        try:
+            if path.startswith(SESSION_ACTION_PATH):
+                session_id, _, action = path[len(SESSION_ACTION_PATH):].partition('/')
+                if action == 'pay':
+                    return 200, self.complete_session(session_id)
+                if action == 'expire':
+                    return 200, self.expire_session(session_id)
+            routes = {
+                ('POST', '/v1/products'): self.create_product,
+                ('POST', '/v1/prices'): self.create_price,
+                ('POST', '/v1/checkout/sessions'): self.create_session,
+                ('GET', '/v1/checkout/sessions'): self.list_sessions,
+            }
+            handler = routes.get((method, path))
+            if handler is not None:
+                with self.lock:
+                    return 200, handler(params)
+            if method == 'GET' and path.startswith('/v1/checkout/sessions/'):
+                with self.lock:
+                    return 200, self.get_session(path.rsplit('/', 1)[1])
+            raise FakeStripeError(404, 'invalid_request_error', f'Unrecognized request URL ({method}: {path}).')
+        except FakeStripeError as e:
+            return e.status, e.body
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """HTTP-обработчик; настройки берутся из атрибутов сервера"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._serve('GET')
+
+    def do_POST(self):
+        self._serve('POST')
+
+    def _serve(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        params = decode_params(parse_qsl(url.query) + parse_qsl(body))
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if method == 'GET' and url.path.startswith(PAY_PATH):
+            try:
+                session = server.stripe.complete_session(url.path[len(PAY_PATH):])
+            except FakeStripeError as e:
+                return self._send_json(e.status, e.body)
+            location = (session.get('success_url') or '/').replace('{CHECKOUT_SESSION_ID}', session['id'])
+            self.send_response(303)
+            self.send_header('Location', location)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if url.path.startswith('/v1/') and random.random() < server.error_rate:
+            status, payload = server.error_status, {
+                'error': {'type': 'api_error', 'message': 'Injected failure from fake Stripe.'}
+            }
+        else:
+            status, payload = server.stripe.handle(
+                method, url.path, params, self.headers.get('Idempotency-Key')
+            )
+        self._send_json(status, payload)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Request-Id', f'req_{secrets.token_hex(8)}')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Fake Stripe: {format % args}")
+
+
+def make_server(host='127.0.0.1', port=12111, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                webhook_url=None, webhook_secret='', complete_after=None):
+    """
+    Создает сервер (еще не запущенный). latency и jitter - задержка ответа
+    в секундах, error_rate - доля запросов к /v1/, завершаемых error_status.
+    complete_after - через сколько секунд автоматически оплачивать новую
+    сессию (None - только по ссылке session.url или .../pay).
+    """
+    server = ThreadingHTTPServer((host, port), FakeStripeHandler)
+    server.daemon_threads = True
+    server.latency, server.jitter = latency, jitter
+    server.error_rate, server.error_status = error_rate, error_status
+    server.stripe = FakeStripe(
+        f'http://{host}:{server.server_address[1]}',
+        webhook_url=webhook_url, webhook_secret=webhook_secret, complete_after=complete_after,
+    )
+    return server
@@ -0,0 +1,44 @@
+# users/management/commands/fake_stripe.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.fake_stripe import make_server
+
+
+class Command(BaseCommand):
+    help = ('Запускает локальную замену Stripe API для нагрузочных тестов оплаты. '
+            'Приложение направляется на нее переменной STRIPE_API_BASE=http://<host>:<port>')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0.0, help='Задержка каждого ответа, секунды')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Случайная добавка к задержке, секунды')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов к API с ошибкой (0..1)')
+        parser.add_argument('--error-status', type=int, default=500, help='HTTP-статус внедренной ошибки')
+        parser.add_argument('--webhook-url', default='http://localhost:8000/api/users/payments/webhook/',
+                            help='Куда отправлять подписанные вебхуки (пустая строка - не отправлять)')
+        parser.add_argument('--webhook-secret', default=getattr(settings, 'STRIPE_WEBHOOK_SECRET', ''),
+                            help='Секрет подписи вебхуков (по умолчанию STRIPE_WEBHOOK_SECRET)')
+        parser.add_argument('--complete-after', type=float, default=None,
+                            help='Через сколько секунд автоматически оплачивать новую сессию')
+
+    def handle(self, *args, **options):
+        server = make_server(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            webhook_url=options['webhook_url'] or None,
+            webhook_secret=options['webhook_secret'],
+            complete_after=options['complete_after'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Fake Stripe слушает {server.stripe.base_url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.10 on 2026-10-17 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_entitlements(apps, schema_editor):
+    """Доступы по уже оплаченным платежам"""
+    Payment = apps.get_model('users', 'Payment')
+    Entitlement = apps.get_model('users', 'Entitlement')
+    payments = Payment.objects.filter(status='paid').order_by('id').values_list(
+        'id', 'user_id', 'paid_course_id', 'paid_lesson_id'
+    )
+    batch = []
+    for payment_id, user_id, course_id, lesson_id in payments.iterator(chunk_size=2000):
+        if course_id:
+            lesson_id = None
+        elif not lesson_id:
+            continue
+        batch.append(Entitlement(user_id=user_id, course_id=course_id, lesson_id=lesson_id, payment_id=payment_id))
+        if len(batch) >= 2000:
+            Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Entitlement.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_stripe_price_amount'),
+        ('users', '0004_stripe_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Entitlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granted_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата предоставления')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course', verbose_name='Курс')),
+                ('lesson', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.lesson', verbose_name='Урок')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='users.payment', verbose_name='Платеж')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entitlements', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Доступ',
+                'verbose_name_plural': 'Доступы',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('course__isnull', False)), fields=('user', 'course'), name='entitlement_user_course_uniq'), models.UniqueConstraint(condition=models.Q(('lesson__isnull', False)), fields=('user', 'lesson'), name='entitlement_user_lesson_uniq'), models.CheckConstraint(condition=models.Q(models.Q(('course__isnull', False), ('lesson__isnull', True)), models.Q(('course__isnull', True), ('lesson__isnull', False)), _connector='OR'), name='entitlement_course_or_lesson')],
+            },
+        ),
+        migrations.RunPython(backfill_entitlements, migrations.RunPython.noop),
+    ]
@@ -55,6 +55,14 @@ class User(AbstractUser):
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
         ordering = ['email']
+        indexes = [
+            # Поиск неактивных пользователей (block_inactive_users)
+            models.Index(fields=['last_login'], name='user_active_last_login_idx',
+                         condition=models.Q(is_active=True)),
+            # Пакетный обход неактивных пользователей в порядке id
+            models.Index(fields=['id', 'last_login'], name='user_active_id_login_idx',
+                         condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         return self.email
@@ -121,8 +129,85 @@ class Payment(models.Model):
         verbose_name = 'Платеж'
         verbose_name_plural = 'Платежи'
         ordering = ['-created_at']
+        indexes = [
+            # Вебхук и страницы success/cancel ищут платеж по сессии Stripe
+            models.Index(fields=['stripe_session_id'], name='payment_session_idx'),
+            models.Index(fields=['user', 'status'], name='payment_user_status_idx'),
+            # Проверки "уже оплачено" смотрят только на оплаченные платежи
+            models.Index(fields=['user', 'paid_course'], name='payment_paid_course_idx',
+                         condition=models.Q(status='paid')),
+            models.Index(fields=['user', 'paid_lesson'], name='payment_paid_lesson_idx',
+                         condition=models.Q(status='paid')),
+        ]
 
 
     def __str__(self):
         item = self.paid_course.title if self.paid_course else self.paid_lesson.title
-        return f"Платеж {self.id} - {self.user.email} - {self.amount} {self.currency} - {item}"
\ No newline at end of file
+        return f"Платеж {self.id} - {self.user.email} - {self.amount} {self.currency} - {item}"
+
+
+class StripeEvent(models.Model):
+    """
+    Входящее событие Stripe (inbox).
+
+    Вебхук только сохраняет проверенное событие и сразу отвечает 200;
+    применяет события пачками задача process_stripe_events. Уникальный
+    event_id делает повторные доставки Stripe безопасными.
+    """
+    event_id = models.CharField(max_length=255, unique=True, verbose_name='ID события Stripe')
+    event_type = models.CharField(max_length=100, verbose_name='Тип события')
+    payload = models.JSONField(verbose_name='Событие')
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата обработки')
+
+    class Meta:
+        verbose_name = 'Событие Stripe'
+        verbose_name_plural = 'События Stripe'
+        ordering = ['id']
+        indexes = [
+            # Очередь необработанных событий
+            models.Index(fields=['id'], name='stripe_event_pending_idx',
+                         condition=models.Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id}"
+
+
+class Entitlement(models.Model):
+    """
+    Доступ пользователя к оплаченному курсу или уроку.
+
+    Строка появляется, когда платеж переходит в статус paid (вебхук, сверка,
+    страница успеха), поэтому проверка "уже оплачено" не просматривает
+    таблицу платежей. Набор доступов пользователя кешируется, см.
+    users/entitlements.py.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='entitlements',
+                             verbose_name='Пользователь')
+    course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, null=True, blank=True,
+                               verbose_name='Курс')
+    lesson = models.ForeignKey('courses.Lesson', on_delete=models.CASCADE, null=True, blank=True,
+                               verbose_name='Урок')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True,
+                                verbose_name='Платеж')
+    granted_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата предоставления')
+
+    class Meta:
+        verbose_name = 'Доступ'
+        verbose_name_plural = 'Доступы'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='entitlement_user_course_uniq',
+                                    condition=models.Q(course__isnull=False)),
+            models.UniqueConstraint(fields=['user', 'lesson'], name='entitlement_user_lesson_uniq',
+                                    condition=models.Q(lesson__isnull=False)),
+            models.CheckConstraint(
+                condition=models.Q(course__isnull=False, lesson__isnull=True)
+                | models.Q(course__isnull=True, lesson__isnull=False),
+                name='entitlement_course_or_lesson',
+            ),
+        ]
+
+    def __str__(self):
+        item = self.course or self.lesson
+        return f"{self.user} - {item}"
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .roles import is_moderator
+
 
 class IsModerator(permissions.BasePermission):
     """
@@ -7,7 +9,7 @@ class IsModerator(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='moderators').exists()
+        return is_moderator(request)
 
     def has_object_permission(self, request, view, obj):
         return self.has_permission(request, view)
@@ -0,0 +1,63 @@
+# users/roles.py
+from django.conf import settings
+from django.core.cache import cache
+
+MODERATORS_GROUP = 'moderators'
+
+# Имя claim в JWT, в который кладутся роли пользователя
+ROLES_CLAIM = 'roles'
+
+ROLES_CACHE_KEY = 'user_roles:{user_id}'
+
+
+def _cache_key(user_id):
+    return ROLES_CACHE_KEY.format(user_id=user_id)
+
+
+def get_user_roles(user, token=None):
+    """
+    Возвращает роли пользователя (имена его групп) в виде frozenset.
+
+    Роли вычисляются один раз на запрос: результат запоминается на объекте
+    пользователя, который живет ровно один запрос. Между запросами роли
+    хранятся в кеше (Redis) и сбрасываются сигналами при изменении групп.
+    Если включен ROLES_FROM_JWT и в токене есть claim с ролями,
+    обращений к кешу и БД нет вовсе.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles_cache', None)
+    if roles is not None:
+        return roles
+
+    if token is not None and settings.ROLES_FROM_JWT:
+        claim = token.get(ROLES_CLAIM)
+        if claim is not None:
+            roles = frozenset(claim)
+
+    if roles is None:
+        roles = cache.get(_cache_key(user.pk))
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(_cache_key(user.pk), roles, settings.ROLES_CACHE_TIMEOUT)
+
+    user._roles_cache = roles
+    return roles
+
+
+def get_request_roles(request):
+    """Роли текущего пользователя запроса"""
+    return get_user_roles(request.user, getattr(request, 'auth', None))
+
+
+def is_moderator(request):
+    """Является ли пользователь запроса модератором"""
+    return MODERATORS_GROUP in get_request_roles(request)
+
+
+def invalidate_user_roles(user_ids):
+    """Сбрасывает закешированные роли указанных пользователей"""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
@@ -2,7 +2,9 @@ from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import Payment
+from .roles import ROLES_CLAIM, get_user_roles
 
 User = get_user_model()
 
@@ -168,3 +170,13 @@ class UserSerializer(serializers.ModelSerializer):
         else:
             # Для чужого профиля используем публичный сериализатор
             return PublicUserSerializer(instance, context=self.context).data
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Выдача JWT с ролями пользователя в отдельном claim"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token[ROLES_CLAIM] = sorted(get_user_roles(user))
+        return token
@@ -0,0 +1,53 @@
+# users/signals.py
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .entitlements import grant_entitlements
+from .models import Payment, User
+from .roles import invalidate_user_roles
+
+
+def _invalidate(user_ids):
+    """Сбрасывает роли сразу и еще раз после коммита транзакции"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    invalidate_user_roles(user_ids)
+    transaction.on_commit(lambda: invalidate_user_roles(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Состав групп пользователя изменился - роли нужно пересчитать"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.__dict__.pop('_roles_cache', None)
+            _invalidate([instance.pk])
+        return
+
+    # group.user_set.add/remove/clear
+    if action in ('post_add', 'post_remove'):
+        _invalidate(pk_set)
+    elif action == 'pre_clear':
+        _invalidate(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Переименование или удаление группы меняет роли всех ее участников"""
+    if instance.pk:
+        _invalidate(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, **kwargs):
+    """
+    Оплаченный платеж дает доступ к курсу или уроку, каким бы путем он ни
+    стал paid (вебхук, опрос статуса, API, админка). bulk_update сигналы
+    не отправляет - там grant_entitlements вызывается явно
+    """
+    if instance.status == 'paid':
+        grant_entitlements([instance])
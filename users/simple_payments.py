@@ -1,10 +1,10 @@
 # users/simple_payments.py
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-import stripe
-from django.conf import settings
 import logging
 
+from courses.services.stripe_service import StripeService
+
 logger = logging.getLogger(__name__)
 
 
@@ -49,8 +49,7 @@ def payment_success(request):
             item_name = "Неизвестный товар"
 
         # Проверяем статус в Stripe
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        stripe_session = stripe.checkout.Session.retrieve(session_id)
+        stripe_session = StripeService.retrieve_session(session_id)
 
         status_color = "#4CAF50" if payment.status == 'paid' else "#FFA500"
         status_icon = "✅" if payment.status == 'paid' else "⏳"
@@ -0,0 +1,147 @@
+# users/stripe_events.py
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from courses.services.stripe_sessions import invalidate_sessions
+
+from .entitlements import grant_entitlements
+from .models import Payment, StripeEvent
+
+logger = logging.getLogger(__name__)
+
+# Отметка о том, что обработка inbox уже запланирована
+PROCESS_SCHEDULED_KEY = 'stripe_events:scheduled'
+
+
+def store_event(event):
+    """
+    Сохраняет проверенное событие Stripe (разобранное тело запроса) в inbox.
+    Повторная доставка того же события игнорируется. Возвращает True,
+    если событие новое.
+    """
+    _, created = StripeEvent.objects.get_or_create(
+        event_id=event['id'],
+        defaults={'event_type': event['type'], 'payload': event},
+    )
+    return created
+
+
+def schedule_processing(countdown=1):
+    """Ставит process_stripe_events не чаще раза в countdown секунд"""
+    if cache.add(PROCESS_SCHEDULED_KEY, 1, timeout=countdown + 1):
+        from .tasks import process_stripe_events
+        transaction.on_commit(lambda: process_stripe_events.apply_async(countdown=countdown))
+
+
+def update_from_session(payment, session):
+    """
+    Переносит в платеж состояние сессии Checkout (из события или из списка
+    сессий). Возвращает True, если платеж изменился.
+    """
+    if session.get('payment_status') == 'paid' and payment.status != 'paid':
+        payment.status = 'paid'
+        payment.stripe_payment_intent_id = session.get('payment_intent') or ''
+        return True
+    if session.get('status') == 'expired' and payment.status == 'pending':
+        payment.status = 'cancelled'
+        return True
+    return False
+
+
+def apply_session_events(events, payments):
+    """
+    Применяет события checkout.session.* к платежам из payments
+    ({stripe_session_id: Payment}). Возвращает измененные платежи.
+    """
+    changed = {}
+    for event in events:
+        session = event.payload['data']['object']
+        payment = payments.get(session['id'])
+        if payment is None:
+            logger.error(f"Платеж с session_id {session['id']} не найден (событие {event.event_id})")
+            continue
+        if update_from_session(payment, session):
+            changed[payment.pk] = payment
+            logger.info(f"Платеж {payment.id}: статус {payment.status} по событию {event.event_type}")
+    return list(changed.values())
+
+
+def process_event_batch(batch_size):
+    """
+    Применяет пачку необработанных событий: платежи пачки загружаются
+    одним запросом и сохраняются одним bulk_update. Строки, заблокированные
+    другим обработчиком, пропускаются. Возвращает число событий.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        session_events = [event for event in events if event.event_type.startswith('checkout.session.')]
+        session_ids = {event.payload['data']['object']['id'] for event in session_events}
+        payments = {payment.stripe_session_id: payment
+                    for payment in Payment.objects.select_for_update().filter(stripe_session_id__in=session_ids)}
+        changed = apply_session_events(session_events, payments)
+        invalidate_sessions(session_ids)
+
+        now = timezone.now()
+        for payment in changed:
+            payment.updated_at = now
+        Payment.objects.bulk_update(changed, ['status', 'stripe_payment_intent_id', 'updated_at'])
+        # bulk_update не отправляет post_save: доступы выдаются явно
+        grant_entitlements(changed)
+
+        for event in events:
+            if event.event_type == 'payment_intent.succeeded':
+                logger.info(f"PaymentIntent успешен: {event.payload['data']['object']['id']}")
+            elif event.event_type == 'payment_intent.payment_failed':
+                logger.warning(f"PaymentIntent не удался: {event.payload['data']['object']['id']}")
+
+        StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=now)
+    return len(events)
+
+
+def reconcile_pending_payments(window, batch_size):
+    """
+    Сверяет ожидающие платежи за последние window с сессиями Stripe за один
+    проход по списку сессий и сохраняет изменения через bulk_update.
+    Обход списка прекращается, как только найдены все ожидающие платежи.
+    Возвращает число обновленных платежей.
+    """
+    from courses.services.stripe_service import StripeService
+
+    since = timezone.now() - window
+    pending = {
+        payment.stripe_session_id: payment
+        for payment in Payment.objects.filter(status='pending', created_at__gte=since)
+        .exclude(stripe_session_id='').only(
+            'id', 'user_id', 'paid_course_id', 'paid_lesson_id', 'status', 'stripe_session_id',
+            'stripe_payment_intent_id',
+        )
+    }
+    if not pending:
+        return 0
+
+    changed, remaining = [], len(pending)
+    for session in StripeService.list_sessions(created_after=since):
+        payment = pending.get(session['id'])
+        if payment is None:
+            continue
+        if update_from_session(payment, session):
+            payment.updated_at = timezone.now()
+            changed.append(payment)
+        remaining -= 1
+        if not remaining:
+            break
+
+    with transaction.atomic():
+        Payment.objects.bulk_update(changed, ['status', 'stripe_payment_intent_id', 'updated_at'], batch_size=batch_size)
+        grant_entitlements(changed)
+    logger.info(f"Сверка со Stripe: ожидало {len(pending)}, обновлено {len(changed)}")
+    return len(changed)
@@ -1,25 +1,127 @@
 # users/tasks.py
+import logging
+
 from celery import shared_task
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 
+from .stripe_events import process_event_batch, reconcile_pending_payments
+
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
 
-@shared_task
-def block_inactive_users():
+# Последний обработанный id: повторный запуск после сбоя продолжает с него
+INACTIVE_USERS_CURSOR_KEY = 'users:block_inactive:cursor'
+# Запуск уже выполняется; блокировка продлевается после каждой пачки
+INACTIVE_USERS_LOCK_KEY = 'users:block_inactive:lock'
+INACTIVE_USERS_LOCK_TIMEOUT = 10 * 60
+
+
+def deactivate_inactive_chunk(threshold, cursor, chunk_size):
+    """
+    Блокирует следующую пачку неактивных пользователей с id больше cursor.
+    Возвращает (число заблокированных, последний id) или (0, None) в конце.
+    """
+    with transaction.atomic():
+        # Обход по (id, last_login) из частичного индекса is_active=True:
+        # каждая пачка читает только свои строки и блокирует их ненадолго
+        ids = list(
+            User.objects.filter(is_active=True, last_login__lt=threshold, pk__gt=cursor)
+            .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return 0, None
+        count = User.objects.filter(pk__in=ids, is_active=True, last_login__lt=threshold).update(is_active=False)
+    return count, ids[-1]
+
+
+def deactivate_inactive_users(on_progress=None):
+    """
+    Блокирует пользователей, которые не заходили более месяца.
+
+    Пользователи обходятся пачками по INACTIVE_USERS_CHUNK_SIZE в порядке id,
+    каждая пачка коммитится отдельно. Позиция сохраняется в кеше, поэтому
+    прерванный запуск продолжается с места остановки. Одновременно
+    выполняется только один запуск. После каждой пачки вызывается
+    on_progress(заблокировано, последний id). Возвращает число
+    заблокированных пользователей или None, если уже идет другой запуск.
+    """
+    if not cache.add(INACTIVE_USERS_LOCK_KEY, 1, timeout=INACTIVE_USERS_LOCK_TIMEOUT):
+        logger.info("Блокировка неактивных: предыдущий запуск еще выполняется")
+        return None
+
+    try:
+        one_month_ago = timezone.now() - timedelta(days=30)
+        chunk_size = settings.INACTIVE_USERS_CHUNK_SIZE
+        cursor = cache.get(INACTIVE_USERS_CURSOR_KEY, 0)
+
+        count = 0
+        while True:
+            chunk_count, last_id = deactivate_inactive_chunk(one_month_ago, cursor, chunk_size)
+            if last_id is None:
+                break
+            cursor = last_id
+            count += chunk_count
+            cache.set(INACTIVE_USERS_CURSOR_KEY, cursor, timeout=None)
+            cache.touch(INACTIVE_USERS_LOCK_KEY, INACTIVE_USERS_LOCK_TIMEOUT)
+            logger.info(f"Блокировка неактивных: заблокировано {count}, обработано до id {cursor}")
+            if on_progress:
+                on_progress(count, cursor)
+
+        cache.delete(INACTIVE_USERS_CURSOR_KEY)
+        return count
+    finally:
+        cache.delete(INACTIVE_USERS_LOCK_KEY)
+
+
+def report_progress(task):
+    """Прогресс пакетной задачи в ее состоянии (PROGRESS) в backend результатов"""
+    def on_progress(blocked, last_id):
+        if task.request.id:
+            task.update_state(state='PROGRESS', meta={'blocked': blocked, 'last_id': last_id})
+    return on_progress
+
+
+@shared_task(bind=True)
+def block_inactive_users(self):
     """
     Проверяет пользователей по дате последнего входа (last_login)
     и блокирует тех, кто не заходил более месяца
     """
-    one_month_ago = timezone.now() - timedelta(days=30)
-    inactive_users = User.objects.filter(
-        last_login__lt=one_month_ago,
-        is_active=True
-    )
+    count = deactivate_inactive_users(report_progress(self))
+    if count is None:
+        return "Блокировка неактивных пользователей уже выполняется"
+    return f"Заблокировано {count} неактивных пользователей"
 
-    count = inactive_users.count()
-    inactive_users.update(is_active=False)
 
-    return f"Заблокировано {count} неактивных пользователей"
+@shared_task
+def process_stripe_events():
+    """
+    Применяет сохраненные вебхуком события Stripe пачками по
+    STRIPE_EVENTS_BATCH_SIZE, пока inbox не опустеет. Запускается вебхуком
+    (с задержкой, чтобы собрать всплеск событий в пачку) и по расписанию.
+    """
+    batch_size = settings.STRIPE_EVENTS_BATCH_SIZE
+    processed = 0
+    while True:
+        count = process_event_batch(batch_size)
+        processed += count
+        if count < batch_size:
+            return processed
+
+
+@shared_task
+def reconcile_stripe_payments():
+    """
+    Периодическая сверка ожидающих платежей с сессиями Stripe за последние
+    STRIPE_RECONCILE_WINDOW_HOURS часов: статусы подтягиваются в БД, и
+    эндпоинтам статуса не нужно обращаться к Stripe при каждом опросе
+    """
+    window = timedelta(hours=settings.STRIPE_RECONCILE_WINDOW_HOURS)
+    updated = reconcile_pending_payments(window, settings.STRIPE_EVENTS_BATCH_SIZE)
+    return f"Обновлено {updated} платежей"
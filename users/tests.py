@@ -1,3 +1,326 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from config import settings as config_settings
+from courses.models import Course, Lesson
+from courses.services.stripe_sessions import SESSION_CACHE_KEY, SESSION_LOCK_KEY, get_checkout_session
+from users.fake_stripe import make_server, sign_payload
+from users.entitlements import get_entitlements, grant_entitlements, has_entitlement
+from users.models import Entitlement, Payment, StripeEvent, User
+from users.tasks import (
+    INACTIVE_USERS_CURSOR_KEY, INACTIVE_USERS_LOCK_KEY, block_inactive_users, deactivate_inactive_users,
+    process_stripe_events, reconcile_stripe_payments,
+)
+
+
+@override_settings(INACTIVE_USERS_CHUNK_SIZE=2)
+class BlockInactiveUsersTests(TestCase):
+    """Тесты пакетной блокировки неактивных пользователей"""
+
+    def setUp(self):
+        cache.clear()
+        old_login = timezone.now() - timedelta(days=40)
+        self.inactive = [
+            User.objects.create_user(email=f'inactive{number}@example.com', password='testpass123', last_login=old_login)
+            for number in range(5)
+        ]
+        self.active = User.objects.create_user(
+            email='active@example.com', password='testpass123', last_login=timezone.now()
+        )
+
+    def test_blocks_in_chunks(self):
+        """Тест: неактивные блокируются пачками, прогресс сообщается после каждой"""
+        progress = []
+
+        count = deactivate_inactive_users(lambda blocked, last_id: progress.append(blocked))
+
+        self.assertEqual(count, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertFalse(User.objects.filter(pk__in=[user.pk for user in self.inactive], is_active=True).exists())
+        self.assertTrue(User.objects.get(pk=self.active.pk).is_active)
+        self.assertIsNone(cache.get(INACTIVE_USERS_CURSOR_KEY))
+
+    def test_resumes_from_cursor(self):
+        """Тест: прерванный запуск продолжается с сохраненного id"""
+        cache.set(INACTIVE_USERS_CURSOR_KEY, self.inactive[2].pk)
+
+        result = block_inactive_users()
+
+        self.assertEqual(result, "Заблокировано 2 неактивных пользователей")
+        self.assertEqual(User.objects.filter(is_active=False).count(), 2)
+
+    def test_check_inactive_users_shares_cursor(self):
+        """Тест: прежняя задача courses продолжает тот же прерванный запуск"""
+        from courses.tasks import check_inactive_users
+
+        cache.set(INACTIVE_USERS_CURSOR_KEY, self.inactive[2].pk)
+
+        result = check_inactive_users()
+
+        self.assertEqual(result, "Заблокировано 2 неактивных пользователей")
+        self.assertIsNone(cache.get(INACTIVE_USERS_CURSOR_KEY))
+
+    def test_overlapping_run_is_skipped(self):
+        """Тест: пока идет один запуск, второй ничего не делает"""
+        cache.set(INACTIVE_USERS_LOCK_KEY, 1)
+
+        self.assertIsNone(deactivate_inactive_users())
+        self.assertEqual(block_inactive_users(), "Блокировка неактивных пользователей уже выполняется")
+        self.assertFalse(User.objects.filter(is_active=False).exists())
+
+        cache.delete(INACTIVE_USERS_LOCK_KEY)
+        self.assertEqual(deactivate_inactive_users(), 5)
+        self.assertIsNone(cache.get(INACTIVE_USERS_LOCK_KEY))
+
+
+@mock.patch.object(config_settings, 'STRIPE_WEBHOOK_SECRET', 'whsec_test', create=True)
+@mock.patch('users.views.stripe.Webhook.construct_event')
+class StripeWebhookTests(APITestCase):
+    """Тесты приема вебхуков Stripe через inbox"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(email='buyer@example.com', password='testpass123')
+        course = Course.objects.create(title='Курс', description='Описание курса', owner=user, price=1000)
+        self.payment = Payment.objects.create(
+            user=user, paid_course=course, amount=1000, stripe_session_id='cs_test_1', status='pending'
+        )
+
+    def post_event(self, event_id):
+        event = {
+            'id': event_id,
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_test_1', 'payment_status': 'paid', 'payment_intent': 'pi_1'}},
+        }
+        return self.client.post(
+            '/api/users/payments/webhook/', json.dumps(event), content_type='application/json',
+            HTTP_STRIPE_SIGNATURE='t=1,v1=test'
+        )
+
+    def test_event_is_stored_and_applied_later(self, construct_event):
+        """Тест: вебхук только сохраняет событие, платеж обновляет задача"""
+        with mock.patch('users.tasks.process_stripe_events.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post_event('evt_1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        apply_async.assert_called_once()
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+        self.assertEqual(process_stripe_events(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.stripe_payment_intent_id), ('paid', 'pi_1'))
+        self.assertIsNotNone(StripeEvent.objects.get(event_id='evt_1').processed_at)
+
+    def test_redelivery_is_ignored(self, construct_event):
+        """Тест: повторная доставка события не создает вторую запись"""
+        with mock.patch('users.tasks.process_stripe_events.apply_async'):
+            self.post_event('evt_1')
+            response = self.post_event('evt_1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_webhook_invalidates_cached_session(self, construct_event):
+        """Тест: вебхук сбрасывает сессию, закешированную для опроса статуса"""
+        cache.set(SESSION_CACHE_KEY.format(session_id='cs_test_1'), SimpleNamespace(payment_status='unpaid'))
+        with mock.patch('users.tasks.process_stripe_events.apply_async'):
+            self.post_event('evt_1')
+        self.assertIsNone(cache.get(SESSION_CACHE_KEY.format(session_id='cs_test_1')))
+
+
+class StripeReconciliationTests(TestCase):
+    """Тесты периодической сверки платежей со Stripe"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='reconcile@example.com', password='testpass123')
+        course = Course.objects.create(title='Курс', description='Описание курса', owner=user, price=1000)
+        self.payments = [
+            Payment.objects.create(
+                user=user, paid_course=course, amount=1000, stripe_session_id=f'cs_test_{number}', status='pending'
+            )
+            for number in range(3)
+        ]
+
+    @mock.patch('courses.services.stripe_service.StripeService.list_sessions')
+    def test_pending_payments_are_updated_in_one_pass(self, list_sessions):
+        """Тест: оплаченные и истекшие сессии обновляют платежи, открытые не трогают"""
+        list_sessions.return_value = iter([
+            {'id': 'cs_other', 'status': 'complete', 'payment_status': 'paid'},
+            {'id': 'cs_test_0', 'status': 'complete', 'payment_status': 'paid', 'payment_intent': 'pi_0'},
+            {'id': 'cs_test_1', 'status': 'expired', 'payment_status': 'unpaid'},
+            {'id': 'cs_test_2', 'status': 'open', 'payment_status': 'unpaid'},
+        ])
+
+        self.assertEqual(reconcile_stripe_payments(), "Обновлено 2 платежей")
+        list_sessions.assert_called_once()
+        statuses = dict(Payment.objects.values_list('stripe_session_id', 'status'))
+        self.assertEqual(statuses, {'cs_test_0': 'paid', 'cs_test_1': 'cancelled', 'cs_test_2': 'pending'})
+        self.assertEqual(list(Entitlement.objects.values_list('payment_id', flat=True)), [self.payments[0].pk])
+
+    @mock.patch('courses.services.stripe_service.StripeService.list_sessions')
+    def test_no_stripe_call_without_pending_payments(self, list_sessions):
+        """Тест: без ожидающих платежей Stripe не вызывается"""
+        Payment.objects.update(status='paid')
+
+        reconcile_stripe_payments()
+        list_sessions.assert_not_called()
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_fake')
+@mock.patch.object(config_settings, 'STRIPE_WEBHOOK_SECRET', 'whsec_test', create=True)
+class FakeStripePipelineTests(APITestCase):
+    """Тесты покупки целиком на локальной замене Stripe"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_server(port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='testpass123')
+        self.course = Course.objects.create(title='Курс', description='Описание курса', owner=self.user, price=1000)
+
+    def test_purchase_and_signed_webhook(self):
+        """Тест: покупка создает сессию в замене Stripe, подписанный вебхук оплачивает платеж"""
+        fake = self.server.stripe
+        self.client.force_authenticate(user=self.user)
+        with override_settings(STRIPE_API_BASE=fake.base_url):
+            response = self.client.post(
+                '/api/users/payments/buy/', {'item_type': 'course', 'item_id': self.course.id}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['payment_url'].startswith(fake.base_url))
+        self.assertEqual(fake.sessions[response.data['session_id']]['amount_total'], 100000)
+
+        session = fake.complete_session(response.data['session_id'])
+        payload = json.dumps(fake.build_event('checkout.session.completed', session))
+        with mock.patch('users.tasks.process_stripe_events.apply_async'):
+            response = self.client.post(
+                '/api/users/payments/webhook/', payload, content_type='application/json',
+                HTTP_STRIPE_SIGNATURE=sign_payload(payload, 'whsec_test'),
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        process_stripe_events()
+        payment = Payment.objects.get(stripe_session_id=session['id'])
+        self.assertEqual((payment.status, payment.stripe_payment_intent_id), ('paid', session['payment_intent']))
+
+
+class EntitlementTests(APITestCase):
+    """Тесты таблицы доступов к оплаченным курсам и урокам"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='owner@example.com', password='testpass123')
+        self.course = Course.objects.create(title='Курс', description='Описание курса', owner=self.user, price=1000)
+        self.payment = Payment.objects.create(
+            user=self.user, paid_course=self.course, amount=1000, stripe_session_id='cs_test_1', status='pending'
+        )
+
+    def test_paid_payment_grants_access_once(self):
+        """Тест: доступ выдается только по оплаченному платежу и без дубликатов"""
+        self.assertEqual(grant_entitlements([self.payment]), 0)
+        self.assertFalse(has_entitlement(self.user, course=self.course))
+
+        self.payment.status = 'paid'
+        grant_entitlements([self.payment])
+        grant_entitlements([self.payment])
+
+        self.assertEqual(Entitlement.objects.filter(user=self.user).count(), 1)
+        self.assertTrue(has_entitlement(self.user, course=self.course))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_entitlements(self.user.pk), {('course', self.course.pk)})
+
+    def test_saving_paid_payment_grants_access(self):
+        """Тест: платеж, переведенный в paid обычным save (API, админка), дает доступ"""
+        self.assertFalse(has_entitlement(self.user, course=self.course))
+
+        self.payment.status = 'paid'
+        self.payment.save()
+
+        self.assertTrue(has_entitlement(self.user, course=self.course))
+        self.assertEqual(Entitlement.objects.get(user=self.user).payment_id, self.payment.pk)
+
+    def test_buy_is_rejected_after_payment(self):
+        """Тест: повторная покупка оплаченного курса отклоняется без обращения к Stripe"""
+        self.payment.status = 'paid'
+        self.payment.save()
+
+        self.client.force_authenticate(user=self.user)
+        with mock.patch('users.views.StripeService.create_checkout_session') as create_session:
+            response = self.client.post(
+                '/api/users/payments/buy/', {'item_type': 'course', 'item_id': self.course.id}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        create_session.assert_not_called()
+
+    def test_free_item_is_rejected_before_stripe(self):
+        """Тест: урок с нулевой ценой не отправляется в Stripe"""
+        lesson = Lesson.objects.create(
+            title='Урок', description='Описание урока', video_url='https://youtube.com/watch?v=abc',
+            course=self.course, owner=self.user,
+        )
+        self.client.force_authenticate(user=self.user)
+        with mock.patch('users.views.get_stripe_price_id') as get_price, \
+                mock.patch('users.views.StripeService.create_checkout_session') as create_session:
+            response = self.client.post(
+                '/api/users/payments/buy/', {'item_type': 'lesson', 'item_id': lesson.id}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        get_price.assert_not_called()
+        create_session.assert_not_called()
+
+
+@mock.patch('courses.services.stripe_sessions.StripeService.retrieve_session')
+class StripeSessionCacheTests(TestCase):
+    """Тесты кеша сессий Stripe для опроса статуса"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_polls_hit_cache(self, retrieve_session):
+        """Тест: повторный опрос в пределах TTL не обращается к Stripe"""
+        retrieve_session.return_value = SimpleNamespace(id='cs_test_1', payment_status='unpaid')
+
+        self.assertEqual(get_checkout_session('cs_test_1').payment_status, 'unpaid')
+        self.assertEqual(get_checkout_session('cs_test_1').payment_status, 'unpaid')
+        retrieve_session.assert_called_once_with('cs_test_1')
+
+    def test_concurrent_poll_waits_for_inflight_request(self, retrieve_session):
+        """Тест: пока запрос к Stripe выполняется, другой опрос ждет его результат"""
+        cache.set(SESSION_LOCK_KEY.format(session_id='cs_test_1'), 1)
+        timer = threading.Timer(0.1, cache.set, (
+            SESSION_CACHE_KEY.format(session_id='cs_test_1'), SimpleNamespace(id='cs_test_1', payment_status='paid'),
+        ))
+        timer.start()
+
+        self.assertEqual(get_checkout_session('cs_test_1').payment_status, 'paid')
+        timer.join()
+        retrieve_session.assert_not_called()
+
+    @override_settings(STRIPE_SESSION_WAIT_TIMEOUT=0.1)
+    def test_wait_for_inflight_request_is_bounded(self, retrieve_session):
+        """Тест: если чужой запрос к Stripe не завершился за отведенное время, опрос не ждет дальше"""
+        from courses.services.stripe_client import StripeUnavailable
+
+        cache.set(SESSION_LOCK_KEY.format(session_id='cs_test_1'), 1)
+        with self.assertRaises(StripeUnavailable):
+            get_checkout_session('cs_test_1')
+        retrieve_session.assert_not_called()
@@ -10,10 +10,16 @@ from rest_framework.filters import OrderingFilter
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 
 from config import settings
+from courses.paginators import PaymentPagination, PaymentCursorPagination, SelectablePaginationMixin
+from courses.services.stripe_registry import get_stripe_price_id
 from courses.services.stripe_service import StripeService
+from courses.services.stripe_sessions import get_checkout_session, invalidate_sessions
+from .entitlements import has_entitlement
 from .models import Payment
+from .stripe_events import schedule_processing, store_event
 from .serializers import UserSerializer, UserRegisterSerializer, PaymentSerializer, PaymentCreateSerializer
 from .permissions import IsOwner, IsModerator
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,9 +71,11 @@ class UserViewSet(viewsets.ModelViewSet):
         return None
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(SelectablePaginationMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = PaymentPagination
+    cursor_pagination_class = PaymentCursorPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['paid_course', 'paid_lesson', 'payment_method', 'status']
     ordering_fields = ['created_at', 'amount']
@@ -138,48 +146,27 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 item_name = item.title
 
             # Проверяем, не куплено ли уже
-            existing_payment = Payment.objects.filter(
-                user=user,
-                paid_course=item if item_type == 'course' else None,
-                paid_lesson=item if item_type == 'lesson' else None,
-                status='paid'
-            ).exists()
-
-            if existing_payment:
+            if item_type == 'course':
+                already_paid = has_entitlement(user, course=item)
+            else:
+                already_paid = has_entitlement(user, lesson=item)
+
+            if already_paid:
                 return Response(
                     {'detail': 'Вы уже приобрели этот элемент'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Получаем или создаем Stripe ID
-            stripe_product_id = item.stripe_product_id
-            stripe_price_id = item.stripe_price_id
-
-            # Если нет Stripe ID, создаем их
-            if not stripe_product_id or not stripe_price_id:
-                logger.info(f"Создаем Stripe продукт для {item_type} '{item_name}'")
-
-                product = StripeService.create_product(
-                    name=item_name,
-                    description=f"Оплата за {item_type}: {item_name}"
-                )
-
-                price = StripeService.create_price(
-                    product_id=product.id,
-                    amount=float(amount),
-                    currency='rub'
+            # Stripe не создает сессию оплаты на нулевую сумму
+            if amount <= 0:
+                return Response(
+                    {'detail': 'Этот элемент бесплатный, оплата не требуется'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
-                # Сохраняем ID в модель
-                item.stripe_product_id = product.id
-                item.stripe_price_id = price.id
-                item.save()
-
-                stripe_product_id = product.id
-                stripe_price_id = price.id
-                logger.info(f"Созданы Stripe ID: product={product.id}, price={price.id}")
-            else:
-                logger.info(f"Используем существующие Stripe ID для {item_type} {item_id}")
+            # Stripe ID создаются один раз на версию цены и берутся из БД/кеша
+            stripe_price_id = get_stripe_price_id(item)
+            stripe_product_id = item.stripe_product_id
 
             # Используем прямые URL
             success_url = 'http://localhost:8000/api/users/payments/success/?session_id={CHECKOUT_SESSION_ID}'
@@ -239,7 +226,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         summary="Проверить статус платежа",
-        description="Проверяет актуальный статус платежа через Stripe API",
+        description="""Возвращает статус платежа. Завершенные платежи отдаются из БД
+        (их обновляют вебхук и периодическая сверка), к Stripe API обращаемся
+        только пока платеж ожидает оплаты.""",
         tags=['Платежи']
     )
     @action(detail=True, methods=['get'], url_path='status')
@@ -248,17 +237,14 @@ class PaymentViewSet(viewsets.ModelViewSet):
         payment = self.get_object()
 
         # Обновляем статус из Stripe
-        if payment.stripe_session_id:
+        if payment.stripe_session_id and payment.status == 'pending':
             try:
-                session = StripeService.retrieve_session(payment.stripe_session_id)
+                session = get_checkout_session(payment.stripe_session_id)
 
                 if session.payment_status == 'paid' and payment.status != 'paid':
                     payment.status = 'paid'
                     payment.stripe_payment_intent_id = session.payment_intent
                     payment.save()
-                elif session.payment_status == 'unpaid' and payment.status == 'paid':
-                    payment.status = 'pending'
-                    payment.save()
 
             except Exception as e:
                 logger.error(f"Ошибка обновления статуса платежа: {e}")
@@ -466,6 +452,9 @@ def stripe_webhook(request):
     """
     Обработчик вебхуков от Stripe.
     Настройте вебхук в Stripe Dashboard на этот URL.
+
+    Проверенное событие сохраняется в StripeEvent и сразу подтверждается,
+    повторы по event.id игнорируются.
     """
     payload = request.body
     sig_header = request.headers.get('Stripe-Signature')
@@ -476,7 +465,7 @@ def stripe_webhook(request):
         return Response({'error': 'Webhook секрет не настроен'}, status=400)
 
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, webhook_secret
         )
     except ValueError as e:
@@ -488,52 +477,17 @@ def stripe_webhook(request):
         logger.error(f"Неверная подпись вебхука: {e}")
         return Response({'error': str(e)}, status=400)
 
-    # Обработка событий
-    event_type = event['type']
-    logger.info(f"Получено событие Stripe: {event_type}")
-
-    if event_type == 'checkout.session.completed':
-        session = event['data']['object']
-
-        try:
-            payment = Payment.objects.get(stripe_session_id=session['id'])
-
-            if session['payment_status'] == 'paid' and payment.status != 'paid':
-                payment.status = 'paid'
-                payment.stripe_payment_intent_id = session.get('payment_intent')
-                payment.save()
-
-                logger.info(f"Платеж {payment.id} отмечен как оплаченный через вебхук")
-
-                # Здесь можно добавить дополнительную логику:
-                # - Отправить email пользователю
-                # - Активировать доступ к курсу
-                # - Обновить статистику
-
-        except Payment.DoesNotExist:
-            logger.error(f"Платеж с session_id {session['id']} не найден")
-
-    elif event_type == 'checkout.session.expired':
-        session = event['data']['object']
-
-        try:
-            payment = Payment.objects.get(stripe_session_id=session['id'])
-            payment.status = 'cancelled'
-            payment.save()
-            logger.info(f"Платеж {payment.id} истек")
-        except Payment.DoesNotExist:
-            pass
-
-    elif event_type == 'payment_intent.succeeded':
-        # Дополнительная обработка успешного платежа
-        payment_intent = event['data']['object']
-        logger.info(f"PaymentIntent успешен: {payment_intent['id']}")
-
-    elif event_type == 'payment_intent.payment_failed':
-        # Обработка неудачного платежа
-        payment_intent = event['data']['object']
-        logger.warning(f"PaymentIntent не удался: {payment_intent['id']}")
+    # Событие только сохраняется, применяет его process_stripe_events
+    event = json.loads(payload)
+    if event['type'].startswith('checkout.session.'):
+        # Опрос статуса не должен отдавать сессию из кеша в прежнем состоянии
+        invalidate_sessions([event['data']['object']['id']])
+    if store_event(event):
+        schedule_processing()
+    else:
+        logger.info(f"Повторная доставка события Stripe {event['id']}")
 
+    event_type = event['type']
     return Response({'status': 'success', 'event': event_type})
 
 